@@ -0,0 +1,281 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+from parser import simpleparser
+from checker import checker
+from checker import metrics
+from plandomains import generator
+import argparse
+import contextlib
+import filecmp
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+
+#the phases of a run, in order
+phases = ["parse", "hsequence", "build", "dot", "sat"]
+
+#the parameters of the generated domains that can be swept, see printScaling
+dimensions = ["types", "actions", "hdepth", "density"]
+
+def runDomain(task):
+    """Runs all the phases on one domain, in a fresh worker process
+    (so that its peak RSS is the run's own), with the output of the
+    phases discarded. Returns the measurements, with the nodes and the
+    formula of a build over the relevant actions only (spaceCut.py -r),
+    made last, outside the phases and the peak RSS. With checkdeepen, the
+    non-plans are also built again under a tiny memory budget (spilled
+    after every level) in two deepen steps, and compared to the first."""
+    fname, depth, share, classes, outdir, checkdeepen = task
+    timr = metrics.metrics()
+    base = os.path.join(outdir, os.path.basename(fname))
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with timr.phase("parse"):
+            pd = simpleparser.parser().loadFile(fname)
+            if classes:
+                pd = pd.getQuotient()
+
+        with timr.phase("hsequence"):
+            pd.getHsequence()
+
+        with timr.phase("build"):
+            check = checker.oracle(pd)
+            check.metrics = timr
+            initnode = check.buildNonPlans(float("inf") if depth is None else depth)
+
+        with timr.phase("dot"):
+            check.dumpNonPlansInDot(base + ".dot")
+
+        with timr.phase("sat"):
+            with open(base + ".smt", 'w') as satf:
+                check.writeSMT(initnode, satf, share)
+
+        if checkdeepen:
+            stepped = checker.oracle(pd)
+            stepped.setMemoryBudget(1e-6)
+            first = 1 if depth is None else depth // 2
+            stepped.buildNonPlans(first)
+            stepnode = stepped.deepen(float("inf") if depth is None else depth - first)
+            with open(base + ".step.smt", 'w') as satf:
+                stepped.writeSMT(stepnode, satf, share)
+            deepenmatches = len(stepped.utable) == len(check.utable) and stepped.depth == check.depth and \
+                filecmp.cmp(base + ".smt", base + ".step.smt", shallow = False)
+            os.remove(base + ".step.smt")
+
+    peakrsskb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        relcheck = checker.oracle(pd)
+        relnode = relcheck.buildNonPlans(float("inf") if depth is None else depth, 1, True)
+        with open(base + ".rel.smt", 'w') as satf:
+            relcheck.writeSMT(relnode, satf, share)
+
+    timr.setBytes("dot", os.path.getsize(base + ".dot"))
+    timr.setBytes("sat", os.path.getsize(base + ".smt"))
+    res = {"domain": os.path.basename(fname), "depth": depth, "phases": timr.phases, "levels": timr.levels,
+           "actions": len(pd.actions), "concreteactions": pd.countConcreteActs(), "indexedactions": len(pd.hactnames),
+           "uniquenodes": len(check.utable), "treenodes": check.countTreeNodes(),
+           "dotbytes": os.path.getsize(base + ".dot"), "satbytes": os.path.getsize(base + ".smt"),
+           "relevantactions": len(pd.maskToActIds(pd.getRelevantActs())), "relevantnodes": len(relcheck.utable),
+           "relevantsatbytes": os.path.getsize(base + ".rel.smt"),
+           #ru_maxrss is in kilobytes on Linux
+           "peakrsskb": peakrsskb}
+    if checkdeepen:
+        res["deepenmatches"] = deepenmatches
+    os.remove(base + ".dot")
+    os.remove(base + ".smt")
+    os.remove(base + ".rel.smt")
+    return res
+
+def depthDesc(depth):
+    return "inf" if depth is None else str(depth)
+
+def compareToBaseline(results, baseline, tolerance, mintime):
+    """Lists the regressions of results against baseline: a phase slower
+    by more than the tolerance factor (and mintime seconds), more peak
+    memory by the same factor, or different node counts and output sizes."""
+    old = dict([((r["domain"], r["depth"]), r) for r in baseline["results"]])
+    regressions = []
+    for r in results:
+        b = old.get((r["domain"], r["depth"]))
+        if b is None:
+            continue
+        run = "{} (depth {})".format(r["domain"], depthDesc(r["depth"]))
+
+        for p in phases:
+            now, then = r["phases"][p]["cpu"], b["phases"][p]["cpu"]
+            if now > then * tolerance and now - then > mintime:
+                regressions.append("{}: {} took {:.3f} s, was {:.3f} s".format(run, p, now, then))
+
+        if r["peakrsskb"] > b["peakrsskb"] * tolerance:
+            regressions.append("{}: peak RSS {} KB, was {} KB".format(run, r["peakrsskb"], b["peakrsskb"]))
+
+        for k in ["uniquenodes", "treenodes", "dotbytes", "satbytes", "relevantnodes"]:
+            if k in b and r[k] != b[k]:
+                regressions.append("{}: {} is {}, was {}".format(run, k, r[k], b[k]))
+    return regressions
+
+def printTable(results):
+    """The CPU time of each phase, the nodes and the peak RSS of each run,
+    then the same counts with -r: the actions that can feed the goal out
+    of the indexed ones, the nodes, and the size of the formula against
+    the one without."""
+    print("{:<12}{:>6}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}".format("domain", "depth", \
+        *(phases + ["nodes", "RSS MB", "acts", "-r acts", "-r nodes", "-r SAT"])))
+    for r in results:
+        print("{:<12}{:>6}".format(r["domain"], depthDesc(r["depth"])) + \
+              "".join(["{:>10.3f}".format(r["phases"][p]["cpu"]) for p in phases]) + \
+              "{:>10}{:>10.1f}{:>10}{:>10}{:>10}{:>9.0f}%".format(r["uniquenodes"], r["peakrsskb"] / 1024.0, \
+                  r["indexedactions"], r["relevantactions"], r["relevantnodes"], 100.0 * r["relevantsatbytes"] / max(r["satbytes"], 1)))
+
+def printScaling(results):
+    """For each swept parameter of the generated domains, the CPU time and
+    peak RSS of each phase against it, the other parameters fixed, with
+    the growth of the total time from the previous value. The RSS of a
+    phase is the peak of the run up to its end."""
+    for dim in dimensions:
+        if len(set([r["generator"][dim] for r in results])) < 2:
+            continue
+        print("\n{:^45}".format("--- Scaling with {} ---".format(dim)))
+        print("".join(["{:>8}".format(d) for d in dimensions]) + "{:>6}".format("depth") + \
+              "".join(["{:>10}".format(p) for p in phases]) + "".join(["{:>13}".format(p + " MB") for p in phases]) + \
+              "{:>10}".format("growth"))
+
+        #the runs differing in dim only, ordered by it
+        fixed = lambda r: tuple([r["generator"][d] for d in dimensions if d != dim]) + (depthDesc(r["depth"]),)
+        prev = {}
+        for r in sorted(results, key = lambda r: (fixed(r), r["generator"][dim])):
+            x = r["generator"][dim]
+            line = "".join(["{:>8}".format(r["generator"][d]) for d in dimensions]) + "{:>6}".format(depthDesc(r["depth"])) + \
+                   "".join(["{:>10.3f}".format(r["phases"][p]["cpu"]) for p in phases]) + \
+                   "".join(["{:>13.1f}".format(r["phases"][p]["peakrsskb"] / 1024.0) for p in phases])
+            #the exponent k of time ~ x^k, between consecutive values
+            last = prev.get(fixed(r))
+            total = sum([r["phases"][p]["cpu"] for p in phases])
+            if last is not None and last[1] > 0 and total > 0 and last[0] > 0 and x != last[0]:
+                line += "{:>10.2f}".format(math.log(total / last[1]) / math.log(float(x) / last[0]))
+            print(line)
+            prev[fixed(r)] = (x, total)
+
+
+if __name__ == "__main__":
+    print("{:^45}".format("*** SpaceCut benchmarks ***"))
+    print('-'*45)
+
+    optpar = argparse.ArgumentParser(description='Runs SpaceCut over a benchmark archive and records the measurements.')
+    optpar.add_argument('-a', '--archive', metavar='TARfile', type=str, default=os.path.join("examples", "benchmarks.tar.gz"), \
+                        help='archive of .spt domains (default examples/benchmarks.tar.gz)')
+    optpar.add_argument('-d', '--depths', metavar='D', type=str, default="inf", \
+                        help='comma separated depths of unfolding, inf for unbounded (default inf)')
+    optpar.add_argument('-k', '--select', metavar='REGEX', type=str, help='run only the domains matching REGEX')
+    optpar.add_argument('-o', '--output', metavar='JSONfile', type=str, help='save the results to JSONfile')
+    optpar.add_argument('-b', '--baseline', metavar='JSONfile', type=str, help='compare the results to a saved run')
+    optpar.add_argument('-t', '--tolerance', type=float, default=1.25, \
+                        help='slowdown (and memory growth) factor flagged as a regression (default 1.25)')
+    optpar.add_argument('--mintime', type=float, default=0.05, \
+                        help='ignore slowdowns of a phase smaller than this many seconds (default 0.05)')
+    optpar.add_argument('-s', '--share', help='save the SAT formula with define-fun sharing', action="store_true")
+    optpar.add_argument('--no-classes', help='do not collapse the equivalent actions', action="store_true")
+    optpar.add_argument('--synthetic', metavar='N', type=str, \
+                        help='instead of the archive, run generated domains with N (comma separated) actions')
+    optpar.add_argument('--types', type=str, default="60", \
+                        help='comma separated numbers of types of the generated domains (default 60)')
+    optpar.add_argument('--hdepth', type=str, default="4", \
+                        help='comma separated type hierarchy depths of the generated domains (default 4)')
+    optpar.add_argument('--density', type=str, default="0.3", \
+                        help='comma separated effect densities of the generated domains (default 0.3); \
+                        all the combinations of the listed parameters are run')
+    optpar.add_argument('--check-deepen', help='also build each domain in two deepen steps under a tiny memory budget, \
+                        and fail unless it gives the same non-plans', action="store_true")
+    optpar.add_argument('--seed', type=int, default=0, help='random seed of the generated domains (default 0)')
+
+    args = optpar.parse_args()
+    #full unfoldings of random domains blow up quickly, so bound them by default
+    if args.synthetic != None and args.depths == "inf":
+        args.depths = "4"
+    depths = [None if d == "inf" else int(d) for d in args.depths.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix = "spacecut-bench-")
+    try:
+        if args.synthetic != None:
+            names, params = [], {}
+            for t, n, h, e in itertools.product([int(t) for t in args.types.split(",")], \
+                                                [int(n) for n in args.synthetic.split(",")], \
+                                                [int(h) for h in args.hdepth.split(",")], \
+                                                [float(e) for e in args.density.split(",")]):
+                names.append("syn-t{}-a{}-h{}-d{}.spt".format(t, n, h, e))
+                params[names[-1]] = dict(zip(dimensions, [t, n, h, e]))
+                pd = generator.generateDomain(t, n, h, e, args.seed)
+                with open(os.path.join(workdir, names[-1]), 'w') as outf:
+                    generator.writeDomain(pd, outf)
+        else:
+            with tarfile.open(args.archive) as tarf:
+                members = [m for m in tarf.getmembers() if m.isfile() and m.name.endswith(".spt")]
+                if args.select != None:
+                    members = [m for m in members if re.search(args.select, m.name)]
+                members.sort(key = lambda m: metrics.naturalKey(m.name))
+                names = [os.path.basename(m.name) for m in members]
+                for m in members:
+                    with open(os.path.join(workdir, os.path.basename(m.name)), 'wb') as outf:
+                        shutil.copyfileobj(tarf.extractfile(m), outf)
+
+        tasks = [(os.path.join(workdir, n), d, args.share, not args.no_classes, workdir, args.check_deepen) \
+                 for n in names for d in depths]
+
+        #one process per run, for the peak RSS
+        results = []
+        pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+        for t in tasks:
+            res = pool.apply(runDomain, (t,))
+            if args.synthetic != None:
+                res["generator"] = params[res["domain"]]
+            print("{} (depth {}): {:.3f} s CPU, {} nodes".format(res["domain"], depthDesc(res["depth"]), \
+                sum([p["cpu"] for p in res["phases"].values()]), res["uniquenodes"]), flush = True)
+            results.append(res)
+        pool.close()
+        pool.join()
+    finally:
+        shutil.rmtree(workdir)
+
+    print()
+    printTable(results)
+    if args.synthetic != None:
+        printScaling(results)
+
+    run = {"archive": args.archive if args.synthetic == None else "synthetic", "share": args.share, "classes": not args.no_classes,
+           "generator": None if args.synthetic == None else {"types": args.types, "actions": args.synthetic,
+                                                              "hdepth": args.hdepth, "density": args.density, "seed": args.seed},
+           "python": sys.version.split()[0], "time": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}
+    if args.output != None:
+        with open(args.output, 'w') as outf:
+            json.dump(run, outf, indent = 1)
+        print("Saved in {}.".format(args.output))
+
+    if args.check_deepen:
+        mismatches = [r for r in results if not r["deepenmatches"]]
+        print("\n{:^45}".format("--- Deepening under a memory budget ---"))
+        for r in mismatches:
+            print("MISMATCH {} (depth {}): not the non-plans of a direct build".format(r["domain"], depthDesc(r["depth"])))
+        if len(mismatches) > 0:
+            sys.exit(1)
+        print("Same non-plans as the direct builds.")
+
+    if args.baseline != None:
+        with open(args.baseline) as basef:
+            regressions = compareToBaseline(results, json.load(basef), args.tolerance, args.mintime)
+        print("\n{:^45}".format("--- Compared to {} ---".format(args.baseline)))
+        for r in regressions:
+            print("REGRESSION " + r)
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("No regressions.")
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+
+import queue
+import threading
+import time
+import z3
+from checker import checker
+
+
+class anytimesolver:
+    """Solves for non-plans while they are being built. The oracle's
+    deepen hands each expanded level over (see oracle.listener) and a
+    consumer thread adds it to an incremental z3 solver: one variable per
+    node, defined once its successors are known. The joins not expanded
+    yet are assumed false, so after each level of meets the solver holds
+    the non-plans found up to that depth, a subset of all of them, growing
+    with the depth. New non-plans are reported at each such depth.
+
+    The formula is that of getNonPlansInZ3, but the nodes occur only
+    positively, so a node variable only implies its definition. The
+    disjunction of the actions of a node is made of shared disjunctions
+    of ranges of the root's actions, as a node lacks only a few of them."""
+
+    def __init__(self, check, maxp = 1):
+        self.check = check
+        self.maxp = maxp #at most this many new non-plans per depth
+        self.levels = queue.Queue()
+        self.consumer = None
+        self.root = None #(id, actions) of the initial node
+        self.start = None
+        self.found = 0
+        self.first = None #the seconds to the first non-plan
+
+    def listen(self, level, frontier):
+        """Runs in the building thread: the level is handed over as
+        plain descriptors, as its nodes may be spilled afterwards."""
+        if self.root is None:
+            self.root = (self.check.initn.myid, self.check.initn.acts)
+        descs = []
+        for n in level:
+            if isinstance(n, checker.meet):
+                descs.append((n.myid, True, n.acts, [(a, s.myid, s.acts) for a, s in n.successors]))
+            else:
+                descs.append((n.myid, False, n.acts, [s.myid for s in n.successors]))
+        #the approximation can be solved once the frontier holds no meets
+        joinsonly = len(frontier) == 0 or isinstance(frontier[0], checker.join)
+        self.levels.put((self.check.depth, descs, [n.myid for n in frontier] if joinsonly else None))
+
+    def run(self, depth, jobs = 1, relevant = False):
+        """Builds the non-plans up to depth, solving them on the way.
+        Returns the initial node, as oracle.buildNonPlans."""
+        self.start = time.time()
+        self.check.listener = self.listen
+        self.consumer = threading.Thread(target = self.consume)
+        self.consumer.start()
+        try:
+            initnode = self.check.buildNonPlans(depth, jobs, relevant)
+        finally:
+            self.check.closePool()
+            self.check.listener = None
+            self.levels.put(None)
+            self.consumer.join()
+        return initnode
+
+    def consume(self):
+        self.slv = z3.Solver()
+        self.actvars, self.namevar, self.actvar = None, None, None
+        self.nodevars = {}
+
+        while True:
+            item = self.levels.get()
+            if item is None:
+                return
+            if self.actvars is None:
+                self.actvars, self.namevar, self.actvar = self.check.getZ3Vars(self.check.initn)
+                self.order = self.check.pldom.maskToActIds(self.root[1])
+                self.position = dict([(self.order[i], i) for i in range(len(self.order))])
+                self.segments, self.someof = {}, {}
+
+            depth, descs, frontier = item
+            for d in descs:
+                self.slv.add(z3.Implies(self.getNodeVar(d[0]), self.getDefinition(*d)))
+            if frontier is not None:
+                self.solveDepth(depth, frontier)
+
+    def getNodeVar(self, myid):
+        if myid not in self.nodevars:
+            #'!' can't appear in action names, so the names don't clash
+            self.nodevars[myid] = z3.Bool("n!{}".format(myid))
+        return self.nodevars[myid]
+
+    def getDefinition(self, myid, ismeet, acts, successors):
+        """The formula of an expanded node, as in getNonPlansInZ3,
+        over the variables of its successors."""
+        if len(successors) == 0:
+            if ismeet:
+                return self.getPowerset(acts, self.root[1])
+            return z3.BoolVal(False)
+        if ismeet:
+            return z3.And([z3.Or(z3.And(self.actvar[a], self.getNodeVar(s)), self.getPowerset(sacts, 1 << a)) \
+                           for a, s, sacts in successors])
+        return z3.Or([self.getNodeVar(s) for s in successors])
+
+    def getPowerset(self, actionsIn, actionsOut):
+        """The term of writePowerset, with the same case split."""
+        negs = [z3.Not(self.actvar[a]) for a in self.check.pldom.maskToActIds(actionsOut & ~actionsIn)]
+        if actionsIn != 0 and len(negs) > 0:
+            return z3.And([self.getSomeOf(actionsIn)] + negs)
+        elif actionsIn != 0:
+            return self.getSomeOf(actionsIn)
+        return z3.And(negs)
+
+    def getSomeOf(self, acts):
+        """A term for: some of the actions acts (a subset of the root's)
+        holds. It's a disjunction of the ranges between the missing ones."""
+        if acts not in self.someof:
+            missing = [self.position[a] for a in self.check.pldom.maskToActIds(self.root[1] & ~acts)]
+            bounds = [-1] + missing + [len(self.order)]
+            ranges = sum([self.getRange(lo + 1, hi, 0, len(self.order)) for lo, hi in zip(bounds, bounds[1:])], [])
+            self.someof[acts] = z3.Or(ranges)
+        return self.someof[acts]
+
+    def getRange(self, lo, hi, seglo, seghi):
+        """The segments of [seglo, seghi) covering the range [lo, hi) of the
+        root's actions, halving the segment as in a segment tree."""
+        if hi <= seglo or seghi <= lo or lo >= hi:
+            return []
+        if lo <= seglo and seghi <= hi:
+            return [self.getSegment(seglo, seghi)]
+        mid = (seglo + seghi) // 2
+        return self.getRange(lo, hi, seglo, mid) + self.getRange(lo, hi, mid, seghi)
+
+    def getSegment(self, lo, hi):
+        """A variable for: some of the lo-th to (hi-1)-th actions holds."""
+        if (lo, hi) not in self.segments:
+            if hi - lo == 1:
+                self.segments[(lo, hi)] = self.actvar[self.order[lo]]
+            else:
+                mid = (lo + hi) // 2
+                seg = z3.Bool("s!{}!{}".format(lo, hi))
+                self.slv.add(seg == z3.Or(self.getSegment(lo, mid), self.getSegment(mid, hi)))
+                self.segments[(lo, hi)] = seg
+        return self.segments[(lo, hi)]
+
+    def solveDepth(self, depth, frontier):
+        """Reports up to maxp non-plans not reported before, with the
+        joins of the frontier assumed false (under a fresh guard)."""
+        guard = z3.FreshBool()
+        for j in frontier:
+            self.slv.add(z3.Implies(guard, z3.Not(self.getNodeVar(j))))
+
+        newfound = 0
+        while newfound < self.maxp and self.slv.check(self.getNodeVar(self.root[0]), guard) == z3.sat:
+            model = self.slv.model()
+            values = [z3.is_true(model.eval(v, model_completion = True)) for v in self.actvars]
+            if self.first is None:
+                self.first = time.time() - self.start
+            newfound += 1
+            self.found += 1
+            print("\ndepth {} ({:.4f} sec.): {{ {} }}".format(depth, time.time() - self.start, \
+                ", ".join([str(v) for v, val in zip(self.actvars, values) if val])), flush = True)
+            #the non-plans only grow with the depth, so it's blocked for good
+            self.slv.add(z3.Or([z3.Not(v) if val else v for v, val in zip(self.actvars, values)]))
+
+        if newfound == 0:
+            print("\ndepth {} ({:.4f} sec.): no new non-plans{}".format(depth, time.time() - self.start, \
+                "" if len(frontier) > 0 else ", all found"), flush = True)
+        #retired, the frontier will be defined
+        self.slv.add(z3.Not(guard))
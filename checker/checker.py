@@ -4,31 +4,61 @@
 
 
 from plandomains import planningdomain
+from checker import zdd
+from checker import nodefile
 import numpy as np
 import itertools
 import functools
 import sys
+import io
+import shutil
+import tempfile
+import multiprocessing
+import pickle
+import json
+import time
 
 
 class node:
 
-    #static
-    nodecount = 0
+    #there may be tens of millions of nodes, hence no __dict__
+    __slots__ = ("acts", "target", "pldom", "utable", "successors", "expanded", "myid")
 
-    def __init__(self, acts, target, pldom):
-        self.acts = list(acts)
+    def __init__(self, acts, target, pldom, utable):
+        self.acts = acts #bitmask over pldom's action index
         self.target = target
         self.pldom = pldom
+        self.utable = utable #the nodes read back from a nodefile have none
         self.successors = None
+        self.expanded = False
+        self.myid = len(utable)
 
-        self.myhash = hash((str(self.acts), str(self.target)))
-        self.myid = node.nodecount
-        node.nodecount += 1
+    def targetDesc(self):
+        """To be implemented in derived classes."""
+        pass
+
+    def makeNode(self, kind, acts, target):
+        """Returns the node of the given kind for (acts, target), reusing
+        the one already stored in the unique table if there is one."""
+        return self.utable.getNode(kind, acts, target)
 
     def expand(self):
-        """To be implemented in derived classes. 
-        Returns a set of subnodes that are to be 
+        """Returns a set of subnodes that are to be 
         connected below the node (successors)."""
+        if not self.expanded:
+            self.attachSuccessors(self.successorDescs())
+        return self.getSuccessorsList()
+
+    def successorDescs(self):
+        """To be implemented in derived classes.
+        Returns the compact descriptors of the successors,
+        see joinSuccessorDescs and meetSuccessorDescs."""
+        pass
+
+    def attachSuccessors(self, descs):
+        """To be implemented in derived classes.
+        Makes (or reuses) and connects the successors
+        described by descs, marks the node expanded."""
         pass
 
     def traverse(self):
@@ -54,34 +84,40 @@ class node:
             suclist[ans].traverse()
             
     def __str__(self):
-        return """node no. {} with acts: {} \nand target: {}""".format(self.myid, self.acts, self.target)
+        return """node no. {} with acts: {} \nand target: {}""".format(self.myid, self.pldom.maskToActs(self.acts), self.targetDesc())
 
     def __hash__(self):
-        return self.myhash
+        return hash(uniquetable.getKey(type(self), self.acts, self.target))
 
     def __eq__(self, other):
-        return self.acts == other.acts and min(self.target == other.target)
+        return uniquetable.getKey(type(self), self.acts, self.target) == \
+            uniquetable.getKey(type(other), other.acts, other.target)
 
         
 class join(node):
 
-    def __init__(self, acts, target, pldom):
-        node.__init__(self, acts, target, pldom)
-        self.successors = []
+    __slots__ = ()
+    ismeet = False #see uniquetable.getKey
 
-    def expand(self):
-        #process node
-        for i in range(len(self.target)):
-            if self.target[i] > 0:
+    #the target of a join node is a precondition (or the goal), kept as
+    #its number in the domain, see buildTargets
+    def targetDesc(self):
+        #the targets are relative to the initial world
+        return str(tuple((self.pldom.getTargetVector(self.target) + self.pldom.initvec).tolist()))
 
-                #i-th unitary vector
-                ithunit = np.array([0] * i + [1] + [0]*(len(self.target) - i - 1))
+    def __init__(self, acts, target, pldom, utable):
+        node.__init__(self, acts, target, pldom, utable)
+        self.successors = []
 
-                #build a new meet node
-                mcand = meet(self.acts, ithunit, self.pldom)
-                self.successors.append(mcand)
+    def successorDescs(self):
+        return joinSuccessorDescs(self.target, self.pldom.targetsupport)
 
-        return self.getSuccessorsList()
+    def attachSuccessors(self, descs):
+        self.expanded = True
+        for i in descs:
+            #build a new meet node, targeting the i-th unitary vector
+            mcand = self.makeNode(meet, self.acts, i)
+            self.successors.append(mcand)
 
     def getSuccessorsList(self):
         return list(self.successors)
@@ -92,182 +128,1051 @@ class join(node):
 
 class meet(node):
 
-    def __init__(self, acts, target, pldom):
-        node.__init__(self, acts, target, pldom)
-        self.successors = {} #act -> successor
+    __slots__ = ()
+    ismeet = True
+
+    def __init__(self, acts, target, pldom, utable):
+        node.__init__(self, acts, target, pldom, utable)
+        self.successors = [] #(act index, successor) pairs
+
+    #the target of a meet node is a unitary vector, kept as its type index
+    def targetDesc(self):
+        return self.pldom.typelist[self.target]
 
     def __str__(self):
         return "meet " + node.__str__(self)  + " and successors: (" + \
-            " ".join(["--{}--> {}".format(a, self.successors[a].myid) for a in self.successors]) + ")"
+            " ".join(["--{}--> {}".format(self.pldom.hactnames[a], s.myid) for a, s in self.successors]) + ")"
 
-    def expand(self):
-        #process node
-        for pos in range(len(self.acts)):
-            act = self.acts[pos]
-            effact = self.pldom.getAction(act)[2]
-            preact = self.pldom.getAction(act)[1]
-
-            #test if the effect covers the target
-            if min(effact >= self.target):
-                reducedActs = self.acts[:pos] + self.acts[pos + 1:]
-                
-                #make a new join node
-                mcjoin = join(reducedActs, preact, self.pldom)
-                self.successors[act] = mcjoin
-                
-        return self.getSuccessorsList()
+    def successorDescs(self):
+        return meetSuccessorDescs(self.acts, self.target, self.pldom.typecovers, self.pldom.hactrows)
+
+    def attachSuccessors(self, descs):
+        self.expanded = True
+        for act, row in descs:
+            reducedActs = self.acts & ~(1 << act)
+
+            #make a new join node, targeting the action's precondition
+            mcjoin = self.makeNode(join, reducedActs, self.pldom.rowtargets[row])
+            self.successors.append((act, mcjoin))
 
     def getSuccessorsList(self):
-        return list(self.successors.values())
+        return [s for a, s in self.successors]
+
+class storedjoin(join):
+    """A join node read back from a nodefile; its successors are
+    loaded from the file on each access."""
+
+    __slots__ = ("store",)
+
+    def __init__(self, acts, target, pldom, store, myid, expanded):
+        self.acts, self.target, self.pldom, self.utable = acts, target, pldom, None
+        self.store, self.myid, self.expanded = store, myid, expanded
+
+    @property
+    def successors(self):
+        return [loadStoredNode(self.store, self.pldom, i) for a, i in self.store.getSuccessors(self.myid)]
+
+class storedmeet(meet):
+    """A meet node read back from a nodefile, see storedjoin."""
+
+    __slots__ = ("store",)
+
+    def __init__(self, acts, target, pldom, store, myid, expanded):
+        self.acts, self.target, self.pldom, self.utable = acts, target, pldom, None
+        self.store, self.myid, self.expanded = store, myid, expanded
+
+    @property
+    def successors(self):
+        return [(a, loadStoredNode(self.store, self.pldom, i)) for a, i in self.store.getSuccessors(self.myid)]
+
+def loadStoredNode(store, pldom, myid):
+    """The node with the given id, read from the nodefile store."""
+    kind, expanded, target, acts = store.getRecord(myid)
+    if kind == 1:
+        return storedmeet(acts, target, pldom, store, myid, expanded)
+    return storedjoin(acts, target, pldom, store, myid, expanded)
+
+class storedset:
+    """A set of the ids of the nodes of a nodefile, a byte per stored
+    node. The exporters keep one instead of a set of the visited nodes."""
+
+    def __init__(self, size):
+        self.members = bytearray(size)
+
+    def add(self, myid):
+        self.members[myid] = 1
+
+    def __contains__(self, myid):
+        return self.members[myid] == 1
+
+    def __iter__(self):
+        return iter(np.flatnonzero(np.frombuffer(self.members, dtype = np.uint8)).tolist())
+
+class storedmap:
+    """A dict of the ids of the nodes of a nodefile, kept as an array
+    over all the stored ids, see storedset. The values are of the given
+    numpy dtype, they are read back as Python objects."""
+
+    def __init__(self, size, dtype = object):
+        self.values = np.zeros(size, dtype = dtype)
+        self.keys = storedset(size)
+
+    def __setitem__(self, myid, value):
+        self.values[myid] = value
+        self.keys.add(myid)
+
+    def __getitem__(self, myid):
+        if myid not in self.keys:
+            raise KeyError(myid)
+        return self.values.item(myid)
+
+    def __contains__(self, myid):
+        return myid in self.keys
+
+    def get(self, myid, default = None):
+        return self.values.item(myid) if myid in self.keys else default
+
+def joinSuccessorDescs(target, targetsupport):
+    """The types to be covered below a join node: its meet successors.
+    These are the nonzero entries of the target, listed in advance."""
+    return targetsupport[target]
+
+def meetSuccessorDescs(acts, typeidx, typecovers, hactrows):
+    """The (action index, PRE row) pairs of the remaining actions whose
+    effect covers the type: the join successors of a meet node."""
+    #the remaining actions whose effect covers the target
+    covering = acts & typecovers[typeidx]
+    return [(act, int(hactrows[act])) for act in planningdomain.simpleplanningdomain.maskToActIds(covering)]
+
+#the parts of the domain needed by expandShard, set in each worker process
+workerdom = None
+
+def initWorker(typecovers, hactrows, targetsupport):
+    global workerdom
+    workerdom = (typecovers, hactrows, targetsupport)
+
+def expandShard(shard):
+    """Runs in a worker process: returns the successor descriptors for
+    a list of node descriptors, (True, target) for a join node and
+    (False, acts, type index) for a meet node."""
+    typecovers, hactrows, targetsupport = workerdom
+    res = []
+    for desc in shard:
+        if desc[0]:
+            res.append(joinSuccessorDescs(desc[1], targetsupport))
+        else:
+            res.append(meetSuccessorDescs(desc[1], desc[2], typecovers, hactrows))
+    return res
+
+class uniquetable:
+    """Interns the nodes by their canonical key, so that the non-plans
+    form a shared DAG instead of a tree."""
+
+    #the nodes measured by getMemorySize
+    memorysample = 1024
+
+    def __init__(self, pldom):
+        self.pldom = pldom
+        self.nodes = {} #canonical key -> node
+        self.spilled = 0 #the nodes moved out to a nodefile
+
+    @staticmethod
+    def getKey(kind, acts, target):
+        """The key under which a node is interned: two nodes of the same
+        kind (the stored ones included) with the same remaining actions
+        and target are the same node."""
+        return (kind.ismeet, acts, target)
+
+    def getNode(self, kind, acts, target):
+        key = self.getKey(kind, acts, target)
+        anode = self.nodes.get(key)
+        if anode is None:
+            anode = kind(acts, target, self.pldom, self)
+            self.nodes[key] = anode
+        return anode
+
+    def evict(self, nodes):
+        """Forgets the nodes, once they are stored elsewhere. Their ids
+        stay taken, so the new nodes get the following ones."""
+        for n in nodes:
+            del self.nodes[self.getKey(type(n), n.acts, n.target)]
+        self.spilled += len(nodes)
+
+    def __len__(self):
+        return self.spilled + len(self.nodes)
+
+    def getMemorySize(self):
+        """Bytes taken by the nodes, their successor lists and the table,
+        estimated from (at most) memorysample of the nodes, spread evenly."""
+        step = max(1, len(self.nodes) // uniquetable.memorysample)
+        counted, size, sampled = set(), 0, 0
+        def count(obj):
+            if id(obj) not in counted:
+                counted.add(id(obj))
+                return sys.getsizeof(obj)
+            return 0
+
+        for key, n in itertools.islice(self.nodes.items(), 0, None, step):
+            sampled += 1
+            size += count(key) + count(n) + count(n.target) + count(n.successors)
+            if isinstance(n, meet):
+                for pair in n.successors:
+                    size += count(pair)
+            else:
+                #the meets below a join share its actions
+                size += count(n.acts)
+        return sys.getsizeof(self.nodes) + size * len(self.nodes) // max(1, sampled)
+
+
+class cnfwriter:
+    """Tseitin encoder streaming DIMACS clauses. The clauses go to
+    a temporary file first, as the header needs their number."""
+
+    def __init__(self, nvars):
+        self.nvars = nvars #the variables 1..nvars are reserved
+        self.nclauses = 0
+        self.clausef = tempfile.TemporaryFile('w+')
+
+    def newVar(self):
+        self.nvars += 1
+        return self.nvars
+
+    def addClause(self, lits):
+        self.clausef.write(" ".join([str(l) for l in lits]) + " 0\n")
+        self.nclauses += 1
+
+    def andGate(self, ins):
+        """Returns a variable equivalent to the conjunction of ins."""
+        out = self.newVar()
+        for l in ins:
+            self.addClause([-out, l])
+        self.addClause([out] + [-l for l in ins])
+        return out
+
+    def orGate(self, ins):
+        """Returns a variable equivalent to the disjunction of ins."""
+        out = self.newVar()
+        for l in ins:
+            self.addClause([out, -l])
+        self.addClause([-out] + list(ins))
+        return out
+
+    def save(self, outf):
+        outf.write("p cnf {} {}\n".format(self.nvars, self.nclauses))
+        self.clausef.seek(0)
+        shutil.copyfileobj(self.clausef, outf)
+        self.clausef.close()
+
 
 class oracle:
     
+    #frontiers smaller than jobs * minshard are expanded in-process
+    minshard = 256
+    #the action lists kept at once by dumpNonPlansInDot
+    labelcache = 4096
+
     def __init__(self, pldom):
         self.pldom = pldom
         self.initn = None #the initial node of non-plans
+        self.utable = None
+        self.frontier = None #the nodes to be expanded by deepen
+        self.depth = 0 #the number of levels expanded so far
+        self.budget = None #bytes of live nodes, over which they are spilled
+        self.store = None #the nodefile of the spilled nodes
+        self.metrics = None #records the levels of deepen, if set
+        self.listener = None #called with each level expanded by deepen and the new frontier
+        self.pool = None #the worker processes of deepen, started by the first large frontier
+        self.pooljobs = 0
+
+    def expandFrontier(self, frontier, jobs):
+        """Expands the nodes of the frontier, sharding it among jobs
+        processes if it is large enough. Returns the seconds spent
+        waiting for the processes, 0 if expanded in-process."""
+        if jobs <= 1 or len(frontier) < jobs * oracle.minshard:
+            for n in frontier:
+                n.expand()
+            return 0
+        if self.pool is None or self.pooljobs != jobs:
+            self.closePool()
+            self.pool = multiprocessing.Pool(jobs, initWorker, (self.pldom.typecovers, self.pldom.hactrows, \
+                                                                self.pldom.targetsupport))
+            self.pooljobs = jobs
+
+        descs = [(True, n.target) if isinstance(n, join) else (False, n.acts, n.target) for n in frontier]
+        shardsize = -(-len(frontier) // (jobs * 4))
+        shards = [descs[i:i + shardsize] for i in range(0, len(descs), shardsize)]
+
+        #merging: the unique table dedups the successors, in this process;
+        #this takes about as long as expanding the frontier in-process does,
+        #so sharding it too (by the key hash) would be needed for a speedup
+        mapstart = time.perf_counter()
+        succdescs = sum(self.pool.map(expandShard, shards), [])
+        mapseconds = time.perf_counter() - mapstart
+        for n, sd in zip(frontier, succdescs):
+            n.attachSuccessors(sd)
+        return mapseconds
 
-    def buildNonPlans(self, depth):
+    def closePool(self):
+        """Stops the worker processes of deepen, if any were started."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def buildNonPlans(self, depth, jobs = 1, relevant = False):
         #uses only non-useless actions!
         if self.pldom.kmax == None:
             print("Non-plans: building H - sequence")
             self.pldom.getHsequence()
 
-        self.pldom.moveToOrigin()
+        usefulactions = self.pldom.actsToMask(self.pldom.hactnames)
+        if relevant:
+            #and only those that can feed the goal (see getRelevantActs); the
+            #meets expand only the actions covering their type anyway, so this
+            #cuts only the redundant ones, and the formula has the others set to false
+            usefulactions &= self.pldom.getRelevantActs()
+        self.utable = uniquetable(self.pldom)
+        self.store = None
+        self.initn = self.utable.getNode(join, usefulactions, self.pldom.goaltarget)
+        self.frontier = [self.initn]
+        self.depth = 0
+
+        return self.deepen(depth, jobs)
 
-        usefulactions = [a[0] for a in sum(self.pldom.hsequence, [])]
-        self.initn = join(usefulactions, self.pldom.finalvec, self.pldom)
-        frontier = set()
-        frontier.add(self.initn)
+    def deepen(self, k, jobs = 1):
+        """Expands (at most) k more levels of the non-plans built
+        so far, starting from the last frontier. With jobs > 1, the large
+        frontiers are expanded by worker processes, kept for the following
+        calls until closePool. Only the expansion is shared out: the unique
+        table is merged here, so the build is not faster (see expandFrontier)."""
+        if self.store is not None and len(self.utable.nodes) == 0 and k > 0:
+            #a build that spilled everything, deepened again
+            self.reloadFrontier()
 
         repmsg = ""
         ctr = 0
-        while frontier and ctr < depth:
+        while self.frontier and ctr < k:
 
-            new_frontier = set()
+            #the nodes of a level are all joins or all meets
+            kind = "join" if isinstance(self.frontier[0], join) else "meet"
+            levelstart = time.perf_counter()
+            mapseconds = self.expandFrontier(self.frontier, jobs)
+            levelend = time.perf_counter()
 
-            for n in frontier:
-                new_frontier.update(set(n.expand()))
-            frontier = new_frontier
+            level, new_frontier = self.frontier, {}
+            for n in level:
+                for s in n.getSuccessorsList():
+                    if not s.expanded:
+                        new_frontier[s.myid] = s
+            self.frontier = list(new_frontier.values())
             ctr += 1
+            self.depth += 1
 
-            repmsg = "Frontier size: {}, nodes: {}".format(str(len(frontier)), node.nodecount)
+            repmsg = "Frontier size: {}, nodes: {}".format(str(len(self.frontier)), len(self.utable))
             print("\b"*len(repmsg) + repmsg, end = "", flush = True)
 
-        print("\nCreated. Made {} nodes.".format(node.nodecount))
+            if self.metrics is not None:
+                self.metrics.addLevel(self.depth - 1, kind, len(level), len(self.utable), levelend - levelstart, mapseconds)
+            if self.listener is not None:
+                self.listener(level, self.frontier)
+
+            if self.budget is not None and len(self.utable.nodes) >= self.budgetcheck:
+                self.checkMemoryBudget()
+
+        if self.store is not None:
+            #the exporters read all the nodes from the file
+            self.spillNodes(list(self.utable.nodes.values()))
+            self.frontier = []
+
+        print("\nCreated. Made {} unique nodes, {} tree-equivalent nodes.".format(len(self.utable), \
+                                                                              self.countTreeNodes()))
+        print(self.memoryReport())
 
-        self.pldom.restoreOrigin()
         return self.initn
 
-    def dumpNonPlansInDot(self, fname):
-        #warning - contains a recursive function
+    def setMemoryBudget(self, megabytes):
+        """Once the live nodes take more than the budget, the completed
+        levels are moved to an on-disk nodefile (see spillNodes)."""
+        self.budget = megabytes * 2**20
+        self.budgetcheck = 0 #the number of live nodes to measure them at
 
-        def nodeToDot(anode, dtf):
-            msg = "node: {}\nacts: {}\ntrgt: {}".format(anode.myid, ", ".join(anode.acts), str(tuple(anode.target)))
+    def checkMemoryBudget(self):
+        #measured again only when the live nodes may have grown over the budget
+        memsize = self.utable.getMemorySize()
+        if memsize > self.budget:
+            self.spillNodes([n for n in self.utable.nodes.values() if n.expanded])
+        pernode = memsize / max(1, len(self.utable.nodes))
+        self.budgetcheck = max(len(self.utable.nodes) + 1, int(self.budget / pernode))
 
-            succmsg = ""
-            
-            if type(anode) is meet:
-                shp = "box"
-                for a in anode.successors:
-                    succmsg += "\n{}->{} [label =\" {}\"]".format(anode.myid, anode.successors[a].myid, a)
+    def spillNodes(self, nodes):
+        """Appends the nodes to the nodefile and drops them from memory.
+        The nodes of a level all have the same number of actions, so the
+        unique table needs only the frontier to share the next level."""
+        if self.store is None:
+            self.store = nodefile.nodefile(max(1, -(-len(self.pldom.hactnames) // 64)))
+
+        nodes = sorted(nodes, key = lambda n: n.myid)
+        if len(nodes) > 0 and nodes[-1].myid - nodes[0].myid != len(nodes) - 1:
+            raise ValueError("nodes {} to {} spilled with gaps".format(nodes[0].myid, nodes[-1].myid))
+        succs = [n.successors if isinstance(n, meet) else [(-1, s) for s in n.successors] for n in nodes]
+        self.store.append(nodes[0].myid if len(nodes) > 0 else self.store.count, \
+                          [int(isinstance(n, meet)) for n in nodes], [int(n.expanded) for n in nodes], \
+                          [n.target for n in nodes], self.store.toWords([n.acts for n in nodes]), \
+                          [len(sl) for sl in succs], [a for sl in succs for a, s in sl], \
+                          [s.myid for sl in succs for a, s in sl])
+
+        self.utable.evict(nodes)
+        for n in nodes:
+            #no references left to the spilled nodes
+            n.successors = []
+        if any([n is self.initn for n in nodes]):
+            self.initn = loadStoredNode(self.store, self.pldom, self.initn.myid)
+
+    def reloadFrontier(self):
+        """Takes the unexpanded nodes, spilled at the end of deepen, back
+        from the nodefile into the unique table, as the frontier. They are
+        the last level, hence the last ids stored, and they keep their ids."""
+        ids = self.store.getUnexpanded()
+        if len(ids) > 0 and ids[-1] - ids[0] != len(ids) - 1 or len(ids) > 0 and ids[-1] != self.store.count - 1:
+            raise ValueError("the unexpanded nodes {} to {} are not the last stored".format(ids[0], ids[-1]))
+        recs = [self.store.getRecord(i) for i in ids]
+        first = self.store.count - len(ids)
+        self.store.truncate(first)
+        self.utable.spilled = first
+        self.frontier = [self.utable.getNode(meet if kind == 1 else join, acts, target) for kind, expanded, target, acts in recs]
+        if self.initn.myid >= first:
+            self.initn = self.frontier[self.initn.myid - first]
+
+    def getTargetIds(self):
+        """Maps the (shifted) preconditions to their join targets."""
+        ids = {}
+        for t in range(self.pldom.goaltarget):
+            ids[tuple(self.pldom.getTargetVector(t).tolist())] = t
+        return ids
+
+    def memoryReport(self):
+        if self.store is not None:
+            disksize = self.store.getDiskSize()
+            return "Node store: {} nodes spilled, {:.2f} MB on disk, {:.1f} MB per million nodes.".format( \
+                self.store.count, disksize / 2.0**20, disksize / 2.0**20 * 1e6 / self.store.count)
+        memsize = self.utable.getMemorySize()
+        return "Node store: about {:.2f} MB, {:.1f} MB per million nodes.".format(memsize / 2.0**20, \
+                                                                         memsize / 2.0**20 * 1e6 / len(self.utable))
+
+    def saveCheckpoint(self, fname):
+        """Saves the non-plans built so far, to be resumed by loadCheckpoint."""
+        if self.store is None:
+            nodes, frontier = list(self.utable.nodes.values()), self.frontier
+        else:
+            #all of them were spilled, the frontier is what wasn't expanded
+            nodes = [loadStoredNode(self.store, self.pldom, i) for i in range(self.store.count)]
+            frontier = [nodes[i] for i in self.store.getUnexpanded()]
+
+        index = dict([(nodes[i].myid, i) for i in range(len(nodes))])
+        succs = []
+        for n in nodes:
+            if isinstance(n, join):
+                succs.append([index[s.myid] for s in n.successors])
+            else:
+                succs.append([(a, index[s.myid]) for a, s in n.successors])
+
+        chkp = {"hactnames": self.pldom.hactnames,
+                "finalvec": tuple(self.pldom.originfinal.tolist()),
+                "depth": self.depth,
+                "root": index[self.initn.myid],
+                "frontier": [index[n.myid] for n in frontier],
+                #the join targets are saved as (shifted) vectors
+                "nodes": [(isinstance(n, join), n.acts, tuple(self.pldom.getTargetVector(n.target).tolist()) \
+                           if isinstance(n, join) else n.target, n.expanded) for n in nodes],
+                "successors": succs}
+
+        with open(fname, 'wb') as chkf:
+            pickle.dump(chkp, chkf, pickle.HIGHEST_PROTOCOL)
+
+    def loadCheckpoint(self, fname):
+        """Restores the non-plans saved by saveCheckpoint, for the same domain."""
+        with open(fname, 'rb') as chkf:
+            chkp = pickle.load(chkf)
 
-            elif type(anode) is join:
-                shp = "ellipse"
-                for a in anode.successors:
-                    succmsg += "\n{}->{}".format(anode.myid, a.myid)
+        if self.pldom.kmax == None:
+            print("Non-plans: building H - sequence")
+            self.pldom.getHsequence()
+
+        if chkp["hactnames"] != self.pldom.hactnames or chkp["finalvec"] != tuple(self.pldom.originfinal.tolist()):
+            print("Checkpoint {} was saved for another domain. Quitting.".format(fname))
+            sys.exit()
+
+        #join targets are preconditions, but the root's
+        ids = self.getTargetIds()
+
+        self.utable = uniquetable(self.pldom)
+        nodes = []
+        for i in range(len(chkp["nodes"])):
+            isjoin, acts, target, expanded = chkp["nodes"][i]
+            if not isjoin:
+                nodes.append(self.utable.getNode(meet, acts, target))
+            elif i == chkp["root"]:
+                nodes.append(self.utable.getNode(join, acts, self.pldom.goaltarget))
+            else:
+                nodes.append(self.utable.getNode(join, acts, ids[target]))
+            nodes[-1].expanded = expanded
+
+        for n, succ in zip(nodes, chkp["successors"]):
+            if isinstance(n, join):
+                n.successors = [nodes[j] for j in succ]
+            else:
+                n.successors = [(a, nodes[j]) for a, j in succ]
+
+        self.initn = nodes[chkp["root"]]
+        self.frontier = [nodes[i] for i in chkp["frontier"]]
+        self.depth = chkp["depth"]
+
+        print("Resumed {} unique nodes, unfolded to depth {}.".format(len(self.utable), self.depth))
+        return self.initn
+
+    def newNodeSet(self):
+        """An empty set of node ids. Once the nodes are in a nodefile,
+        the sets (and the dicts of newNodeMap) of the exporters are
+        arrays over the stored ids, not as large as the nodes."""
+        return set() if self.store is None else storedset(self.store.count)
+
+    def newNodeMap(self, dtype = object):
+        """An empty dict of node ids, see newNodeSet; the values of
+        the stored nodes are kept as the numpy dtype."""
+        return {} if self.store is None else storedmap(self.store.count, dtype)
 
-            dtf.write("\n\n{} [label = \"{}\", shape = {}]".format(anode.myid, msg, shp))
-            dtf.write(succmsg)
+    def getNodesPostorder(self, anode = None):
+        """Yields the unique nodes reachable from anode (the initial
+        node by default), each one after all of its successors. Only
+        the path to the current node is kept, so the nodes read from
+        a nodefile are not all in memory at once."""
+        anode = self.initn if anode is None else anode
+        visited = self.newNodeSet()
+        visited.add(anode.myid)
+        stack = [(anode, iter(anode.getSuccessorsList()))]
 
-        def recursiveDumpCall(anode, dtf):
-            nodeToDot(anode, dtf)
-            suclist = anode.getSuccessorsList()            
+        while stack:
+            top, sucit = stack[-1]
+            for n in sucit:
+                if n.myid not in visited:
+                    visited.add(n.myid)
+                    stack.append((n, iter(n.getSuccessorsList())))
+                    break
+            else:
+                stack.pop()
+                yield top
+
+    def countTreeNodes(self, anode = None):
+        """The number of nodes the structure would have if it
+        was unfolded into a tree."""
+        treesize = self.newNodeMap()
+        for n in self.getNodesPostorder(anode):
+            treesize[n.myid] = 1 + sum([treesize[s.myid] for s in n.getSuccessorsList()])
+        return treesize[(self.initn if anode is None else anode).myid]
 
-            for n in suclist:
-                recursiveDumpCall(n, dtf)
+    def walkNonPlans(self, maxdepth = None, maxnodes = None):
+        """Yields the unique nodes reachable from the initial node, each
+        once, in depth-first preorder, with their depth and whether their
+        successors are walked too: not below maxdepth, and none once
+        maxnodes nodes were yielded. Iterative, so any depth will do."""
+        visited, count = self.newNodeSet(), 0
+        stack = [(self.initn, 0)]
+        while stack:
+            anode, depth = stack.pop()
+            if anode.myid in visited:
+                continue
+            visited.add(anode.myid)
+            count += 1
+            descend = maxdepth is None or depth < maxdepth
+            yield anode, depth, descend
 
-        dotf = open(fname, 'w')
-        dotf.write("digraph {} {{".format(fname))
-        recursiveDumpCall(self.initn, dotf)
-        dotf.write("\n}\n")
-        dotf.close()
+            if maxnodes is not None and count >= maxnodes:
+                return
+            if descend:
+                #reversed, so that the first successor is walked first
+                stack.extend([(s, depth + 1) for s in reversed(anode.getSuccessorsList())])
+
+    def getLabelledSuccessors(self, anode):
+        """The (action index, successor) pairs of a meet node, the
+        (None, successor) pairs of a join node."""
+        if isinstance(anode, meet):
+            return anode.successors
+        return [(None, s) for s in anode.getSuccessorsList()]
+
+    def dumpNonPlansInDot(self, fname, maxdepth = None, maxnodes = None, fold = False, full = False):
+        """Streams the non-plans to a dot file, see walkNonPlans for the
+        limits. A node whose successors are left out is dashed, and the
+        nodes left out by maxnodes are shown as '...'. With fold, an edge to
+        a node written before leads to a reference to it, so that the graph
+        becomes a tree, which dot lays out much faster.
+        A node is labelled with the number of its actions and its target
+        (the nonzero entries only), an edge with the action it removes.
+        With full, the labels list all the actions and their classes."""
+        written, linked, refs = self.newNodeSet(), self.newNodeSet(), 0
+        #a join and its meets have the same actions, written close together
+        actslabels, targetlabels = {}, {}
+
+        with open(fname, 'w') as dotf:
+            dotf.write("digraph nonplans {")
+
+            for anode, depth, descend in self.walkNonPlans(maxdepth, maxnodes):
+                written.add(anode.myid)
+                succs = self.getLabelledSuccessors(anode)
+                cut = not descend and len(succs) > 0
+                if full:
+                    if anode.acts not in actslabels:
+                        if len(actslabels) >= oracle.labelcache:
+                            actslabels.clear()
+                        actslabels[anode.acts] = ", ".join(self.pldom.maskToMembers(anode.acts))
+                    label = "node: {}\nacts: {}\ntrgt: {}".format(anode.myid, actslabels[anode.acts], anode.targetDesc())
+                elif isinstance(anode, meet):
+                    label = "{}\n{} acts\n{}".format(anode.myid, bin(anode.acts).count("1"), anode.targetDesc())
+                else:
+                    if anode.target not in targetlabels:
+                        vec = self.pldom.getTargetVector(anode.target) + self.pldom.initvec
+                        targetlabels[anode.target] = ", ".join(["{}: {}".format(self.pldom.typelist[i], vec[i]) \
+                                                                for i in np.flatnonzero(vec)])
+                    label = "{}\n{} acts\n{}".format(anode.myid, bin(anode.acts).count("1"), targetlabels[anode.target])
+                dotf.write("\n\n{} [label = \"{}\", shape = {}{}]".format(anode.myid, label, \
+                    "box" if isinstance(anode, meet) else "ellipse", ", style = dashed" if cut else ""))
+                if cut:
+                    continue
 
-    def dumpNonPlansInSAT(self, anode):
+                for a, s in succs:
+                    target = s.myid
+                    if fold and s.myid in written:
+                        refs += 1
+                        target = "r{}".format(refs)
+                        dotf.write("\n{} [label = \"= {}\", shape = plaintext]".format(target, s.myid))
+                    else:
+                        linked.add(s.myid)
+                    dotf.write("\n{}->{}".format(anode.myid, target))
+                    if a is not None:
+                        dotf.write(" [label =\" {}\"]".format(" | ".join(self.pldom.hactclasses[a]) if full \
+                                                              else self.pldom.hactnames[a]))
+
+            for i in sorted([i for i in linked if i not in written]):
+                dotf.write("\n\n{} [label = \"...\", shape = plaintext]".format(i))
+            dotf.write("\n}\n")
+
+    def dumpNonPlansInJSON(self, fname, maxdepth = None, maxnodes = None):
+        """Streams the non-plans to a compact JSON file, one node a line:
+        [id, "join" or "meet", the actions as a hex bitmask over "actions",
+        target, successors, cut]. A meet's target is a type index, a join's
+        is a key of "targets": the nonzero entries of the precondition (or
+        of the goal), as [type index, value] pairs. The successors of a join
+        are node ids, those of a meet [action index, node id] pairs; cut is
+        1 if they were left out (see walkNonPlans)."""
+        targets = set()
+
+        with open(fname, 'w') as jsonf:
+            jsonf.write("{{\"actions\": {},\n\"types\": {},\n\"root\": {},\n\"nodes\": [".format( \
+                json.dumps(self.pldom.hactclasses), json.dumps(list(self.pldom.typelist)), self.initn.myid))
+
+            sep = "\n"
+            for anode, depth, descend in self.walkNonPlans(maxdepth, maxnodes):
+                if isinstance(anode, meet):
+                    kind, succs = "meet", [[a, s.myid] for a, s in anode.successors]
+                else:
+                    kind, succs = "join", [s.myid for s in anode.getSuccessorsList()]
+                    targets.add(anode.target)
+                cut = not descend and len(succs) > 0
+                jsonf.write(sep + json.dumps([anode.myid, kind, format(anode.acts, "x"), anode.target, \
+                                              [] if cut else succs, int(cut)]))
+                sep = ",\n"
+
+            jsonf.write("],\n\"targets\": {")
+            sep = "\n"
+            for t in sorted(targets):
+                vec = self.pldom.getTargetVector(t) + self.pldom.initvec
+                jsonf.write(sep + "\"{}\": {}".format(t, json.dumps([[int(i), int(vec[i])] for i in np.flatnonzero(vec)])))
+                sep = ",\n"
+            jsonf.write("}}\n")
+
+    def writeSMT(self, anode, outf, share = False):
+        """Writes the whole SMT-lib file of the non-plans below anode: the
+        declarations, then the assertion. With share, each repeated
+        subformula is named once (see writeActionSMTdefns)."""
+        defined = {} if share else None
+        self.writeActionSMTdefns(anode, outf, defined)
+        outf.write("\n(assert ")
+        self.writeNonPlansInSAT(anode, outf, defined)
+        outf.write(")")
+
+    def dumpNonPlansInSAT(self, anode, defined = None):
         """Returns the SAT-formula (in SMT-lib rpn form) that
         describes all the non-plans in the planning domain."""
-        #warning - contains a recursive function
-        firstNode = anode
-        allActs = anode.acts
-
-        #lambda - expressions for joining actions
-        orl = lambda x, y: "(or {} {})".format(x, y)
-        andl = lambda x, y: "(and {} {})".format(x, y)
-
-        def getPowerset(actionsIn, actionsOut = allActs):
-            #returns the power set of actionsIn, with the remaining
-            #actions forbidden (those from actionsOut)
-
-            actsDisjunct = ""
-            if(len(actionsIn)) > 0:
-                actsDisjunct = functools.reduce(orl, actionsIn)
-
-            negatedNonActs = ["(not {})".format(a) for a in actionsOut if a not in actionsIn]
-            negatedNonActsConjunct = "" #conjunction of the negated remaining actions
-            if(len(negatedNonActs)) > 0:
-                negatedNonActsConjunct = functools.reduce(andl, negatedNonActs)
-
-            if len(actsDisjunct) == 0:
-                return negatedNonActsConjunct
-            elif len(negatedNonActsConjunct) == 0:
-                return actsDisjunct
-            else:
-                return "(and {} {})".format(actsDisjunct, negatedNonActsConjunct)
+        strf = io.StringIO()
+        self.writeNonPlansInSAT(anode, strf, defined)
+        return strf.getvalue()
+
+    def writeNonPlansInSAT(self, anode, outf, defined = None, allActs = None):
+        """Streams the formula of dumpNonPlansInSAT to the file object
+        outf. Uses an explicit stack instead of recursion, so the memory
+        used is bounded by the depth of the structure, not by the size
+        of the formula.
+        The subformulas named in defined (see writeActionSMTdefns) are
+        written as references to their definitions."""
+        allActs = anode.acts if allActs is None else allActs
+        names = {} if defined is None else defined
+
+        def pushReduced(op, items):
+            #pushes the tasks writing the reduction of items, each item
+            #being a list of tasks; the stack is popped, hence reversed
+            for it in reversed(items[1:]):
+                stack.append(")")
+                stack.extend(reversed(it))
+                stack.append(" ")
+            stack.extend(reversed(items[0]))
+            if len(items) > 1:
+                stack.append("({} ".format(op) * (len(items) - 1))
 
-        def recursiveNonPlansInSATCall(anode):
+        #a task is either a string to write, a node whose formula is to be
+        #written, or a (bitmask in, bitmask out) pair for the power set
+        stack = [anode]
+        while stack:
+            task = stack.pop()
 
-            retv = ""
-            suclist = anode.getSuccessorsList()
-            if len(suclist) == 0: 
+            if type(task) is str:
+                outf.write(task)
+
+            elif type(task) is tuple:
+                self.writePowerset(outf, task[0], task[1], defined)
+
+            elif task.myid in names:
+                outf.write(names[task.myid])
+
+            elif len(task.getSuccessorsList()) == 0:
             #case: a terminal node
-                if type(anode) is meet:
-                    #the power set of anode.acts is the solution here
-                    return getPowerset(anode.acts)
+                if isinstance(task, meet):
+                    #the power set of task.acts is the solution here
+                    stack.append((task.acts, allActs))
                     
-                elif type(anode) is join:
+                elif isinstance(task, join):
                     #the solution here is the empty set 
-                    return "false"
+                    outf.write("false")
 
                 else:
                     print("Error in SAT building. Unknown node type")
                     sys.exit()
 
-            if type(anode) is meet:
-            #case: a non-terminal node (len(suclist) > 0)
+            elif isinstance(task, meet):
+            #case: a non-terminal node
                 successorsCallResults = []
-                for an in anode.successors.items():
-                    offact = an[0]
+                for an in task.successors:
+                    offact = self.getActionTerm(an[0])
                     targetNode = an[1]
-                    noOffactPower = getPowerset(targetNode.acts, [offact])
-                    offactOut = recursiveNonPlansInSATCall(targetNode)
-                    offactIn = "(and {} {})".format(offact, offactOut)
-                    successorsCallResults.append("(or {} {})".format(offactIn, noOffactPower))
+                    noOffactPower = (targetNode.acts, 1 << an[0])
+                    successorsCallResults.append(["(or (and {} ".format(offact), targetNode, ") ", noOffactPower, ")"])
+                pushReduced("and", successorsCallResults)
+
+            elif isinstance(task, join):
+                pushReduced("or", [[n] for n in task.getSuccessorsList()])
+
+    @classmethod
+    def writeReduced(cls, outf, op, items):
+        """Writes the same as functools.reduce of (op x y) over items."""
+        if len(items) > 0:
+            outf.write("({} ".format(op) * (len(items) - 1))
+            outf.write(items[0])
+            for it in items[1:]:
+                outf.write(" {})".format(it))
 
-                if len(successorsCallResults) == 1:
-                    return successorsCallResults[0]
+    def writePowerset(self, outf, actionsIn, actionsOut, defined = None):
+        """Writes the power set of actionsIn, with the remaining
+        actions forbidden (those from actionsOut); both are bitmasks.
+        With defined (see writeActionSMTdefns), the two parts are written
+        as: some of actionsIn holds, none of the forbidden ones holds."""
+        if defined is not None:
+            parts = []
+            if actionsIn != 0:
+                parts.append(self.getSomeOf(actionsIn, defined))
+            if actionsOut & ~actionsIn != 0:
+                parts.append("(not {})".format(self.getSomeOf(actionsOut & ~actionsIn, defined)))
+            oracle.writeReduced(outf, "and", parts)
+            return
+
+        actsIn = self.pldom.maskToMembers(actionsIn)
+        negatedNonActs = ["(not {})".format(a) for a in self.pldom.maskToMembers(actionsOut & ~actionsIn)]
+
+        if len(actsIn) > 0 and len(negatedNonActs) > 0:
+            outf.write("(and ")
+            oracle.writeReduced(outf, "or", actsIn)
+            outf.write(" ")
+            oracle.writeReduced(outf, "and", negatedNonActs)
+            outf.write(")")
+        else:
+            oracle.writeReduced(outf, "or", actsIn)
+            oracle.writeReduced(outf, "and", negatedNonActs)
+
+    def getSegments(self, mask):
+        """The segments (lo, hi) of the action index covering the runs of
+        the actions in mask, halved as in a segment tree over the index:
+        a mask missing a few actions takes a few segments per gap."""
+        edges = self.pldom.maskToActIds(mask ^ (mask << 1)) #where the runs start and end
+        segs = []
+        def cover(lo, hi, seglo, seghi):
+            if hi <= seglo or seghi <= lo:
+                return
+            if lo <= seglo and seghi <= hi:
+                segs.append((seglo, seghi))
+                return
+            mid = (seglo + seghi) // 2
+            cover(lo, hi, seglo, mid)
+            cover(lo, hi, mid, seghi)
+        for lo, hi in zip(edges[0::2], edges[1::2]):
+            cover(lo, hi, 0, len(self.pldom.hactnames))
+        return segs
+
+    def getSomeOf(self, mask, defined):
+        """The SMT-lib term for: some of the actions in mask holds, over
+        the segments named in defined (see writeActionSMTdefns)."""
+        if ("or", mask) in defined:
+            return defined[("or", mask)]
+        terms = [self.getActionTerm(lo) if hi - lo == 1 else defined[("seg", lo, hi)] for lo, hi in self.getSegments(mask)]
+        return terms[0] if len(terms) == 1 else "(or {})".format(" ".join(terms))
+
+    def writeNonPlansInDIMACS(self, anode, outf, mapf):
+        """Writes the formula of dumpNonPlansInSAT as Tseitin-encoded
+        DIMACS CNF, with a variable for every unique node and power-set
+        term. The action variables come first, their names are written
+        to mapf as 'index name' lines."""
+        actnames = self.getActionNames(anode)
+        for i in range(len(actnames)):
+            mapf.write("{} {}\n".format(i + 1, actnames[i]))
+        namevar = dict([(actnames[i], i + 1) for i in range(len(actnames))])
+
+        cnf = cnfwriter(len(actnames))
+        falsevar = cnf.newVar()
+        cnf.addClause([-falsevar])
+
+        #an action of a quotient domain holds if any of its class does
+        actvar = {}
+        for a in self.pldom.maskToActIds(anode.acts):
+            members = [namevar[m] for m in self.pldom.hactclasses[a]]
+            actvar[a] = members[0] if len(members) == 1 else cnf.orGate(members)
+
+        #the disjunction of an action set is named once per set, over the
+        #segments of getSegments, each named once from its two halves
+        segvar = {}
+        def segmentVar(lo, hi):
+            if hi - lo == 1:
+                return actvar[lo]
+            if (lo, hi) not in segvar:
+                mid = (lo + hi) // 2
+                segvar[(lo, hi)] = cnf.orGate([segmentVar(lo, mid), segmentVar(mid, hi)])
+            return segvar[(lo, hi)]
+
+        someof = {}
+        def someOfVar(mask):
+            if mask not in someof:
+                segs = [segmentVar(lo, hi) for lo, hi in self.getSegments(mask)]
+                someof[mask] = segs[0] if len(segs) == 1 else cnf.orGate(segs)
+            return someof[mask]
+
+        powersets = {}
+        def powersetVar(actionsIn, actionsOut):
+            #the same case split as writePowerset; none of the actions out
+            #is the negated disjunction of their set
+            outOnly = actionsOut & ~actionsIn
+            if outOnly == 0:
+                return someOfVar(actionsIn) if actionsIn != 0 else -falsevar
+            if actionsIn == 0:
+                return -someOfVar(outOnly)
+            if (actionsIn, outOnly) not in powersets:
+                powersets[(actionsIn, outOnly)] = cnf.andGate([someOfVar(actionsIn), -someOfVar(outOnly)])
+            return powersets[(actionsIn, outOnly)]
+
+        #successors come first in the post-order, so their variables exist
+        nodevar = self.newNodeMap(np.int64)
+        for n in self.getNodesPostorder(anode):
+            if len(n.getSuccessorsList()) == 0:
+                if isinstance(n, meet):
+                    nodevar[n.myid] = powersetVar(n.acts, anode.acts)
                 else:
-                    return functools.reduce(andl, successorsCallResults)
+                    nodevar[n.myid] = falsevar
+
+            elif isinstance(n, meet):
+                conj = []
+                for a, targetNode in n.successors:
+                    offactIn = cnf.andGate([actvar[a], nodevar[targetNode.myid]])
+                    conj.append(cnf.orGate([offactIn, powersetVar(targetNode.acts, 1 << a)]))
+                nodevar[n.myid] = cnf.andGate(conj)
+
+            else:
+                nodevar[n.myid] = cnf.orGate([nodevar[s.myid] for s in n.getSuccessorsList()])
 
-            elif type(anode) is join:
-                if len(suclist) == 1:
-                    return recursiveNonPlansInSATCall(suclist[0])
+        cnf.addClause([nodevar[anode.myid]])
+        cnf.save(outf)
+
+    def getNonPlansInZ3(self, anode):
+        """Builds the formula of dumpNonPlansInSAT directly as a z3 BoolRef,
+        with one subterm per unique node and power-set term. Returns the
+        formula and the action variables (see getActionNames)."""
+        import z3 #optional, only needed here
+
+        actvars, namevar, actvar = self.getZ3Vars(anode)
+
+        powersets = {}
+        def powersetExpr(actionsIn, actionsOut):
+            #the same case split as writePowerset
+            if (actionsIn, actionsOut) not in powersets:
+                acts = [namevar[a] for a in self.pldom.maskToMembers(actionsIn)]
+                negs = [z3.Not(namevar[a]) for a in self.pldom.maskToMembers(actionsOut & ~actionsIn)]
+                if len(acts) > 0 and len(negs) > 0:
+                    psexpr = z3.And([z3.Or(acts)] + negs)
+                elif len(acts) > 0:
+                    psexpr = z3.Or(acts)
                 else:
-                    return functools.reduce(orl, [recursiveNonPlansInSATCall(n) for n in suclist])
+                    psexpr = z3.And(negs)
+                powersets[(actionsIn, actionsOut)] = psexpr
+            return powersets[(actionsIn, actionsOut)]
 
-        return recursiveNonPlansInSATCall(anode)
+        #successors come first in the post-order, so their terms exist
+        nodeexpr = self.newNodeMap()
+        for n in self.getNodesPostorder(anode):
+            if len(n.getSuccessorsList()) == 0:
+                if isinstance(n, meet):
+                    nodeexpr[n.myid] = powersetExpr(n.acts, anode.acts)
+                else:
+                    nodeexpr[n.myid] = z3.BoolVal(False)
 
-    def getActionSMTdefns(self, anode):
-        actres = []
-        for a in anode.acts:
-            actres.append("(declare-fun {} () Bool)".format(a))
-            
-        return "\n".join(actres)
+            elif isinstance(n, meet):
+                nodeexpr[n.myid] = z3.And([z3.Or(z3.And(actvar[a], nodeexpr[s.myid]), powersetExpr(s.acts, 1 << a)) \
+                                           for a, s in n.successors])
+
+            else:
+                nodeexpr[n.myid] = z3.Or([nodeexpr[s.myid] for s in n.getSuccessorsList()])
+
+        return nodeexpr[anode.myid], actvars
+
+    def getZ3Vars(self, anode):
+        """The z3 variables of the actions below anode, the same by
+        name, and the terms of the indexed actions by their index."""
+        import z3
+
+        actvars = [z3.Bool(a) for a in self.getActionNames(anode)]
+        namevar = dict(zip(self.getActionNames(anode), actvars))
+
+        #an action of a quotient domain holds if any of its class does
+        actvar = {}
+        for a in self.pldom.maskToActIds(anode.acts):
+            members = [namevar[m] for m in self.pldom.hactclasses[a]]
+            actvar[a] = members[0] if len(members) == 1 else z3.Or(members)
+        return actvars, namevar, actvar
+
+    def getNonPlansInZDD(self, anode):
+        """Compiles the non-plans of dumpNonPlansInSAT into a zdd over the
+        actions of anode: a join is the union of its successors, a meet
+        the intersection. Returns the diagram, its root and the action
+        names in the order of the zdd variables."""
+        actnames = self.getActionNames(anode)
+        namevar = dict([(actnames[i], i) for i in range(len(actnames))])
+        dd = zdd.zdd(len(actnames))
+
+        #the classes of a quotient domain are expanded to their actions
+        def toVars(mask):
+            return set([namevar[a] for a in self.pldom.maskToMembers(mask & anode.acts)])
+
+        powersets = {}
+        def powersetNode(actionsIn, actionsOut):
+            if (actionsIn, actionsOut) not in powersets:
+                powersets[(actionsIn, actionsOut)] = dd.powerset(toVars(actionsIn), toVars(actionsOut))
+            return powersets[(actionsIn, actionsOut)]
+
+        #successors come first in the post-order, so their diagrams exist
+        noderoot = self.newNodeMap(np.int64)
+        for n in self.getNodesPostorder(anode):
+            if len(n.getSuccessorsList()) == 0:
+                noderoot[n.myid] = powersetNode(n.acts, anode.acts) if isinstance(n, meet) else 0
+
+            elif isinstance(n, meet):
+                res = None
+                for a, s in n.successors:
+                    #a taken with the non-plans below s, or a off and some of s.acts on
+                    offactIn = dd.intersect(noderoot[s.myid], powersetNode(1 << a, 0))
+                    res = dd.union(offactIn, powersetNode(s.acts, 1 << a)) if res is None else \
+                          dd.intersect(res, dd.union(offactIn, powersetNode(s.acts, 1 << a)))
+                noderoot[n.myid] = res
+
+            else:
+                noderoot[n.myid] = functools.reduce(dd.union, [noderoot[s.myid] for s in n.getSuccessorsList()])
+
+        return dd, noderoot[anode.myid], actnames
+
+    def getActionNames(self, anode):
+        """The (non-useless) actions the formulas below anode are over,
+        with the classes of a quotient domain expanded."""
+        return self.pldom.maskToMembers(anode.acts)
+
+    def getActionTerm(self, act):
+        """The SMT-lib term of the indexed action: its name, or the
+        disjunction of its class in a quotient domain."""
+        members = self.pldom.hactclasses[act]
+        if len(members) == 1:
+            return members[0]
+        return "(or {})".format(" ".join(members))
+
+    def getActionSMTdefns(self, anode, defined = None):
+        strf = io.StringIO()
+        self.writeActionSMTdefns(anode, strf, defined)
+        return strf.getvalue()
+
+    def writeActionSMTdefns(self, anode, outf, defined = None):
+        """Writes the declarations of the actions. If the dictionary defined
+        is given, also writes each distinct subformula of the non-plans below
+        anode once, as a define-fun, and records its name in defined, so that
+        writeNonPlansInSAT refers to it instead of repeating it."""
+        outf.write("\n".join(["(declare-fun {} () Bool)".format(a) for a in self.getActionNames(anode)]))
+
+        if defined is None:
+            return
+
+        #'!' can't appear in action names, so the names don't clash
+        def define(key, prefix, writebody):
+            name = "{}!{}".format(prefix, len(defined))
+            outf.write("\n(define-fun {} () Bool ".format(name))
+            writebody()
+            outf.write(")")
+            defined[key] = name
+
+        def defineSegment(lo, hi):
+            #some of the lo-th to (hi-1)-th actions holds, from its halves
+            if hi - lo > 1 and ("seg", lo, hi) not in defined:
+                mid = (lo + hi) // 2
+                defineSegment(lo, mid)
+                defineSegment(mid, hi)
+                define(("seg", lo, hi), "sg", lambda: outf.write("(or {} {})".format( \
+                    self.getSomeOf(((1 << (mid - lo)) - 1) << lo, defined), self.getSomeOf(((1 << (hi - mid)) - 1) << mid, defined))))
+
+        def getPowersetParts(n):
+            #the action sets of the power sets of n (see writePowerset)
+            #that some or none of holds
+            if isinstance(n, join):
+                return []
+            elif len(n.getSuccessorsList()) == 0:
+                pss = [(n.acts, anode.acts)]
+            else:
+                pss = [(s.acts, 1 << a) for a, s in n.successors]
+            return [mask for actionsIn, actionsOut in pss for mask in [actionsIn, actionsOut & ~actionsIn] if mask != 0]
+
+        #only the subformulas used more than once are worth a name
+        refs, noderefs = {}, self.newNodeMap(np.int64)
+        for n in self.getNodesPostorder(anode):
+            for s in n.getSuccessorsList():
+                noderefs[s.myid] = noderefs.get(s.myid, 0) + 1
+            for mask in getPowersetParts(n):
+                refs[mask] = refs.get(mask, 0) + 1
+
+        for n in self.getNodesPostorder(anode):
+            for mask in getPowersetParts(n):
+                if ("or", mask) not in defined:
+                    segs = self.getSegments(mask)
+                    for lo, hi in segs:
+                        defineSegment(lo, hi)
+                    if refs[mask] > 1 and len(segs) > 1:
+                        define(("or", mask), "ps", lambda: outf.write(self.getSomeOf(mask, defined)))
+
+            #terminal joins are as short as their references
+            if noderefs.get(n.myid, 0) > 1 and len(n.getSuccessorsList()) > 0:
+                define(n.myid, "np", lambda: self.writeNonPlansInSAT(n, outf, defined, anode.acts))
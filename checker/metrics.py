@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+
+import contextlib
+import json
+import re
+import resource
+import time
+
+
+class metrics:
+    """Collects the measurements of a run: CPU and real time, peak memory
+    and output bytes of each phase, and the levels of the non-plans
+    unfolding (see oracle.deepen). Optionally traces the Python
+    allocations (tracemalloc) and profiles the run (cProfile)."""
+
+    def __init__(self, tracemem = False):
+        self.phases = {}
+        self.order = [] #phase names, in the order of running
+        self.levels = [] #one record per expanded level
+        self.tracemem = tracemem
+        self.profiler = None
+
+        if self.tracemem:
+            import tracemalloc #optional, it slows the allocations down
+            tracemalloc.start()
+
+    def startPhase(self, name):
+        if self.tracemem:
+            import tracemalloc
+            tracemalloc.reset_peak()
+        self.order.append(name)
+        self.phases[name] = {"cpu": time.process_time(), "wall": time.time()}
+
+    def endPhase(self, name):
+        ph = self.phases[name]
+        ph["cpu"] = time.process_time() - ph["cpu"]
+        ph["wall"] = time.time() - ph["wall"]
+        #ru_maxrss is in kilobytes on Linux
+        ph["peakrsskb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if self.tracemem:
+            import tracemalloc
+            ph["tracedpeakkb"] = tracemalloc.get_traced_memory()[1] // 1024
+        return ph
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.startPhase(name)
+        try:
+            yield
+        finally:
+            self.endPhase(name)
+
+    def setBytes(self, name, nbytes):
+        """Records the size of the output of a phase (an exporter)."""
+        ph = self.phases[name]
+        ph["bytes"] = nbytes
+        ph["bytespersec"] = nbytes / max(ph["wall"], 1e-9)
+
+    def addLevel(self, depth, kind, frontier, nodes, seconds, poolseconds = 0):
+        """Records an expanded level: the kind of its nodes, the size of
+        the frontier expanded, the unique nodes after it and the time, of
+        which poolseconds were spent waiting for the worker processes."""
+        self.levels.append({"depth": depth, "kind": kind, "frontier": frontier, "nodes": nodes, "seconds": seconds,
+                            "poolseconds": poolseconds})
+
+    def getBuildSummary(self):
+        """Nodes created per second, the time spent expanding the join and
+        the meet levels, and the part of it spent in the worker processes
+        (see oracle.expandFrontier). Only that part shrinks with more
+        processes, which bounds the speedup of the build (Amdahl)."""
+        summ = {"joinseconds": sum([l["seconds"] for l in self.levels if l["kind"] == "join"]),
+                "meetseconds": sum([l["seconds"] for l in self.levels if l["kind"] == "meet"]),
+                "poolseconds": sum([l.get("poolseconds", 0) for l in self.levels])}
+        if len(self.levels) > 0:
+            total = summ["joinseconds"] + summ["meetseconds"]
+            summ["nodespersec"] = self.levels[-1]["nodes"] / max(total, 1e-9)
+            summ["poolfraction"] = summ["poolseconds"] / max(total, 1e-9)
+        return summ
+
+    def startProfile(self):
+        import cProfile
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stopProfile(self, fname):
+        """Saves the profile, to be read with pstats."""
+        self.profiler.disable()
+        self.profiler.dump_stats(fname)
+
+    def report(self):
+        """A short human-readable summary."""
+        lines = ["{:<12}{:>10}{:>10}{:>12}".format("phase", "CPU s", "wall s", "peak RSS MB")]
+        for name in self.order:
+            ph = self.phases[name]
+            lines.append("{:<12}{:>10.4f}{:>10.4f}{:>12.1f}".format(name, ph["cpu"], ph["wall"], ph["peakrsskb"] / 1024.0) + \
+                         ("  {:.1f} MB/s".format(ph["bytespersec"] / 2.0**20) if "bytespersec" in ph else ""))
+        if len(self.levels) > 0:
+            summ = self.getBuildSummary()
+            lines.append("{:.0f} nodes/sec, {:.4f} s expanding joins, {:.4f} s expanding meets".format( \
+                summ["nodespersec"], summ["joinseconds"], summ["meetseconds"]))
+            if summ["poolseconds"] > 0:
+                lines.append("{:.0f}% of it waiting for the worker processes, more of them make it at most {:.2f}x faster".format( \
+                    100 * summ["poolfraction"], 1 / max(1 - summ["poolfraction"], 1e-9)))
+        return "\n".join(lines)
+
+    def saveJSON(self, fname):
+        with open(fname, 'w') as outf:
+            json.dump({"phases": dict([(n, self.phases[n]) for n in self.order]), "order": self.order,
+                       "levels": self.levels, "build": self.getBuildSummary()}, outf, indent = 1)
+
+def naturalKey(name):
+    """Sorts the domain names of the results with their numbers in
+    numeric order: dom2 before dom10."""
+    return [int(t) if t.isdigit() else t for t in re.split(r'(\d+)', name)]
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+
+import numpy as np
+import struct
+import tempfile
+
+
+class nodefile:
+    """An append-only on-disk store of the non-plan nodes, read back
+    through memory maps. The i-th record describes the node with id i,
+    hence the nodes have to be appended in the order of their ids.
+    The successors of all the nodes are kept in a second file."""
+
+    def __init__(self, nwords):
+        self.nwords = nwords #the length of an action set, in 64-bit words
+        self.recdtype = np.dtype([("kind", "u1"), ("expanded", "u1"), ("target", "<i8"), \
+                                  ("succstart", "<i8"), ("succcount", "<i4"), ("acts", "<u8", (nwords,))])
+        self.succdtype = np.dtype([("act", "<i4"), ("id", "<i8")])
+        #the same layouts for single reads, which are slow through numpy
+        self.recstruct = struct.Struct("<BBqqi")
+        self.succstruct = struct.Struct("<iq")
+        self.nodef = tempfile.TemporaryFile()
+        self.succf = tempfile.TemporaryFile()
+        self.count = 0
+        self.succcount = 0
+        self.records = None
+        self.succs = None
+
+    def toWords(self, acts):
+        """The action sets (ints) as the rows of an array of 64-bit words."""
+        raw = b"".join([a.to_bytes(8 * self.nwords, "little") for a in acts])
+        return np.frombuffer(raw, dtype = "<u8").reshape(len(acts), self.nwords)
+
+    def append(self, first, kinds, expanded, targets, words, counts, succacts, succids):
+        """Appends the nodes with the ids from first on, which has to follow
+        the last id stored. The nodes are given as columns: kind (0 for a
+        join, 1 for a meet), expanded, target, actions (see toWords) and
+        the number of successors, then the (act, id) of all the successors,
+        in order. The numpy arrays are stored as they are."""
+        if first != self.count:
+            raise ValueError("node {} stored out of order".format(first))
+        counts = np.asarray(counts, dtype = np.int64)
+        recs = np.zeros(len(counts), dtype = self.recdtype)
+        recs["kind"], recs["expanded"], recs["target"] = kinds, expanded, targets
+        recs["succstart"] = self.succcount + np.cumsum(counts) - counts
+        recs["succcount"] = counts
+        recs["acts"] = words
+        succs = np.zeros(len(succids), dtype = self.succdtype)
+        succs["act"], succs["id"] = succacts, succids
+
+        recs.tofile(self.nodef)
+        succs.tofile(self.succf)
+        self.count += len(recs)
+        self.succcount += len(succs)
+        self.records, self.succs = None, None #remapped on the next read
+
+    def truncate(self, count):
+        """Drops the nodes with the ids from count on, which have to be
+        unexpanded: no successors of theirs are stored."""
+        if self.records is None:
+            self.mapFiles()
+        if self.expanded[count:].any():
+            raise ValueError("expanded nodes stored after node {}".format(count))
+        #the maps go before the file shrinks
+        self.records, self.succs, self.expanded, self.recbuf, self.succbuf = None, None, None, None, None
+        self.nodef.truncate(count * self.recdtype.itemsize)
+        self.nodef.seek(0, 2)
+        self.count = min(count, self.count)
+
+    def mapFiles(self):
+        self.nodef.flush()
+        self.succf.flush()
+        #plain arrays over the maps: items of a memmap are memmaps, made slowly
+        self.records = np.memmap(self.nodef, dtype = self.recdtype, mode = "r", shape = (self.count,)).view(np.ndarray) \
+                       if self.count > 0 else np.zeros(0, dtype = self.recdtype)
+        self.succs = np.memmap(self.succf, dtype = self.succdtype, mode = "r", shape = (self.succcount,)).view(np.ndarray) \
+                     if self.succcount > 0 else np.zeros(0, dtype = self.succdtype)
+        self.expanded = self.records["expanded"]
+        self.recbuf = memoryview(self.records.view(np.uint8))
+        self.succbuf = memoryview(self.succs.view(np.uint8))
+
+    def getRecord(self, myid):
+        """The (kind, expanded, target, acts) of the stored node."""
+        if self.records is None:
+            self.mapFiles()
+        start = myid * self.recdtype.itemsize
+        kind, expanded, target, _, _ = self.recstruct.unpack_from(self.recbuf, start)
+        acts = self.recbuf[start + self.recstruct.size:start + self.recdtype.itemsize]
+        return kind, expanded == 1, target, int.from_bytes(acts, "little")
+
+    def getSuccessors(self, myid):
+        """The (act, id) pairs of the successors of the stored node."""
+        if self.records is None:
+            self.mapFiles()
+        _, _, _, start, count = self.recstruct.unpack_from(self.recbuf, myid * self.recdtype.itemsize)
+        size = self.succstruct.size
+        return list(self.succstruct.iter_unpack(self.succbuf[start * size:(start + count) * size]))
+
+    def getUnexpanded(self):
+        """The ids of the stored nodes that were not expanded."""
+        if self.records is None:
+            self.mapFiles()
+        return np.flatnonzero(self.expanded == 0).tolist()
+
+    def getDiskSize(self):
+        return self.count * self.recdtype.itemsize + self.succcount * self.succdtype.itemsize
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+
+import collections
+import hashlib
+import io
+import random
+import threading
+import time
+from parser import simpleparser
+from checker import checker
+
+
+class lrucache:
+    """Keeps at most capacity values, dropping the least recently used.
+    Each value is made once, even if several threads ask for it at once."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict() #key -> [lock, value]
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, make):
+        """The value under key, made by make() if it's not cached.
+        Returns the value and whether it was cached."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [threading.Lock(), None]
+                while len(self.entries) > self.capacity:
+                    self.entries.popitem(last = False)
+            self.entries.move_to_end(key)
+
+        with entry[0]:
+            cached = entry[1] is not None
+            if not cached:
+                #if make fails, the next request tries again
+                entry[1] = make()
+            with self.lock:
+                if cached:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return entry[1], cached
+
+    def getStats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+
+class builtnonplans:
+    """The non-plans of a domain unfolded to a depth, with their ZDD
+    made on the first request that needs it. Only read once built."""
+
+    def __init__(self, check, initnode):
+        self.check = check
+        self.initnode = initnode
+        self.zddlock = threading.Lock()
+        self.zdd = None #(dd, root, actnames)
+
+    def getZDD(self):
+        with self.zddlock:
+            if self.zdd is None:
+                self.zdd = self.check.getNonPlansInZDD(self.initnode)
+            return self.zdd
+
+
+class spacecutservice:
+    """Serves the requests of spaceCutServer. The parsed domains (with
+    their H-sequences) and the built non-plans are cached, keyed by the
+    hash of the domain file and the options of the build. The domains are
+    never modified by the builds, so the requests can share them."""
+
+    def __init__(self, capacity = 16, cachedir = None):
+        self.prs = simpleparser.parser(cachedir)
+        self.domains = lrucache(capacity)
+        self.nonplans = lrucache(capacity)
+
+    def getDomain(self, raw, classes):
+        digest = hashlib.sha1(raw).hexdigest()
+
+        def make():
+            pd = self.prs.loadBytes(raw)
+            if classes:
+                pd = pd.getQuotient()
+            pd.getHsequence()
+            return pd
+
+        return digest, self.domains.get((digest, classes), make)[0]
+
+    def getNonPlans(self, req):
+        """The domain of the request and its non-plans, built for the
+        depth (None for unbounded) and options of the request."""
+        if "domain" in req:
+            raw = req["domain"].encode()
+        else:
+            with open(req["file"], 'rb') as fl:
+                raw = fl.read()
+        classes, relevant, depth = req.get("classes", True), req.get("relevant", False), req.get("depth")
+        digest, pd = self.getDomain(raw, classes)
+
+        def make():
+            check = checker.oracle(pd)
+            return builtnonplans(check, check.buildNonPlans(float("inf") if depth is None else depth, 1, relevant))
+
+        built, cached = self.nonplans.get((digest, classes, relevant, depth), make)
+        return digest, pd, built, cached
+
+    def build(self, req):
+        start = time.time()
+        digest, pd, built, cached = self.getNonPlans(req)
+        return {"domain": digest, "actions": pd.countConcreteActs(), "indexedactions": len(pd.hactnames),
+                "kgoal": pd.kgoal, "kmax": pd.kmax, "depth": built.check.depth,
+                "uniquenodes": len(built.check.utable), "treenodes": built.check.countTreeNodes(),
+                "cached": cached, "seconds": time.time() - start}
+
+    def sat(self, req):
+        """The SMT-lib formula, as spaceCut.py saves it."""
+        digest, pd, built, cached = self.getNonPlans(req)
+        satf = io.StringIO()
+        built.check.writeSMT(built.initnode, satf, req.get("share", False))
+        return satf.getvalue()
+
+    def enumerate(self, req):
+        """The number of non-plans and up to limit of them, in the ZDD
+        order or, with sample, drawn uniformly (seeded by seed)."""
+        digest, pd, built, cached = self.getNonPlans(req)
+        dd, root, actnames = built.getZDD()
+        limit = req.get("limit", 100)
+
+        nonplans = []
+        if req.get("sample", False):
+            rnd = random.Random(req.get("seed", 0))
+            while root != 0 and len(nonplans) < limit:
+                nonplans.append([actnames[v] for v in dd.sample(root, rnd)])
+        else:
+            for vs in dd.enumerate(root):
+                if len(nonplans) >= limit:
+                    break
+                nonplans.append([actnames[v] for v in vs])
+        return {"domain": digest, "count": dd.count(root), "actions": actnames, "nonplans": nonplans}
+
+    def getStats(self):
+        return {"domains": self.domains.getStats(), "nonplans": self.nonplans.getStats()}
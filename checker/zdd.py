@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+
+import random
+import sys
+
+
+class zdd:
+    """Zero-suppressed decision diagrams over the variables 0..nvars-1
+    (the smaller the index, the closer to the root). A diagram is an int:
+    0 is the empty family, 1 is the family holding the empty set only,
+    the others index the node table. Families of action sets are
+    compiled, counted and sampled here without any solver."""
+
+    def __init__(self, nvars):
+        self.nvars = nvars
+        #node table, the terminals are at the bottom level (nvars)
+        self.var = [nvars, nvars]
+        self.lo = [0, 1]
+        self.hi = [0, 1]
+        self.unique = {} #(var, lo, hi) -> node
+        self.cache = {} #(op, f, g) -> node
+        self.counts = {0: 0, 1: 1}
+
+        #the operations recurse at most once per variable
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 2 * nvars + 1000))
+
+    def getNode(self, v, lo, hi):
+        if hi == 0:
+            return lo #zero-suppression
+        key = (v, lo, hi)
+        n = self.unique.get(key)
+        if n is None:
+            n = len(self.var)
+            self.var.append(v)
+            self.lo.append(lo)
+            self.hi.append(hi)
+            self.unique[key] = n
+        return n
+
+    def powerset(self, varsIn, varsOut):
+        """The family of the sets (over all the variables) containing
+        some of varsIn and none of varsOut - varsIn. If varsIn is empty,
+        only the latter constraint is kept."""
+        #built bottom-up, with and without a member of varsIn still needed
+        done, needed = 1, 0 if len(varsIn) > 0 else 1
+        for v in reversed(range(self.nvars)):
+            if v in varsIn:
+                done, needed = self.getNode(v, done, done), self.getNode(v, needed, done)
+            elif v in varsOut:
+                pass #the high child is empty
+            else:
+                done, needed = self.getNode(v, done, done), self.getNode(v, needed, needed)
+        return needed
+
+    def union(self, f, g):
+        if f == 0 or f == g:
+            return g
+        if g == 0:
+            return f
+        if f > g:
+            f, g = g, f
+        key = ('|', f, g)
+        if key not in self.cache:
+            vf, vg = self.var[f], self.var[g]
+            if vf < vg:
+                res = self.getNode(vf, self.union(self.lo[f], g), self.hi[f])
+            elif vf > vg:
+                res = self.getNode(vg, self.union(f, self.lo[g]), self.hi[g])
+            else:
+                res = self.getNode(vf, self.union(self.lo[f], self.lo[g]), self.union(self.hi[f], self.hi[g]))
+            self.cache[key] = res
+        return self.cache[key]
+
+    def intersect(self, f, g):
+        if f == 0 or g == 0:
+            return 0
+        if f == g:
+            return f
+        if f > g:
+            f, g = g, f
+        key = ('&', f, g)
+        if key not in self.cache:
+            vf, vg = self.var[f], self.var[g]
+            if vf < vg:
+                res = self.intersect(self.lo[f], g)
+            elif vf > vg:
+                res = self.intersect(f, self.lo[g])
+            else:
+                res = self.getNode(vf, self.intersect(self.lo[f], self.lo[g]), self.intersect(self.hi[f], self.hi[g]))
+            self.cache[key] = res
+        return self.cache[key]
+
+    def count(self, f):
+        """The exact number of sets in the family."""
+        if f not in self.counts:
+            self.counts[f] = self.count(self.lo[f]) + self.count(self.hi[f])
+        return self.counts[f]
+
+    def sample(self, f, rnd = random):
+        """A set drawn uniformly from the (non-empty) family, as a list of variables."""
+        res = []
+        while f > 1:
+            if rnd.randrange(self.count(f)) < self.count(self.hi[f]):
+                res.append(self.var[f])
+                f = self.hi[f]
+            else:
+                f = self.lo[f]
+        return res
+
+    def enumerate(self, f):
+        """Lazily yields the sets of the family, as lists of variables."""
+        stack = [(f, [])]
+        while stack:
+            f, prefix = stack.pop()
+            if f == 1:
+                yield prefix
+            elif f > 1:
+                stack.append((self.lo[f], prefix))
+                stack.append((self.hi[f], prefix + [self.var[f]]))
+
+    def size(self, f):
+        """The number of nodes of the diagram."""
+        seen, stack = set(), [f]
+        while stack:
+            n = stack.pop()
+            if n > 1 and n not in seen:
+                seen.add(n)
+                stack.extend([self.lo[n], self.hi[n]])
+        return len(seen)
@@ -0,0 +1,22 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+from plandomains import generator
+import argparse
+
+if __name__ == "__main__":
+    optpar = argparse.ArgumentParser(description='Generates a random monotone domain for SpaceCut.')
+    optpar.add_argument('file', metavar='file', type=str, help='output (.spt) file')
+    optpar.add_argument('-t', '--types', type=int, default=100, help='number of types (default 100)')
+    optpar.add_argument('-a', '--actions', type=int, default=250, help='number of actions (default 250)')
+    optpar.add_argument('-d', '--hdepth', type=int, default=3, help='depth of the type hierarchy (default 3)')
+    optpar.add_argument('-e', '--density', type=float, default=0.3, \
+                        help='probability of each further object in an effect or precondition (default 0.3)')
+    optpar.add_argument('-s', '--seed', type=int, default=0, help='random seed (default 0)')
+
+    args = optpar.parse_args()
+    pd = generator.generateDomain(args.types, args.actions, args.hdepth, args.density, args.seed)
+    with open(args.file, 'w') as outf:
+        generator.writeDomain(pd, outf)
+    print("Saved {} types and {} actions in {}.".format(args.types, args.actions, args.file))
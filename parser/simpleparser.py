@@ -3,48 +3,109 @@
 
 
 import re
+import os
+import hashlib
 import numpy as np
 from plandomains import planningdomain
-import sys
 
 
 class parser:
     """Loads an explicit simple planning domain."""
 
-    def __init__(self):
-        vectpatt = r'\s*\((.*)\)'
+    #bump when the layout of the cached arrays changes
+    cacheversion = 2
+
+    def __init__(self, cachedir = None):
+        vectpatt = r'\s*\(([^)]*)\)' #[^)]* can't backtrack past the parenthesis
         self.typeslistre = re.compile(r'types\s*:\s*((\w*\s*,\s*)*\w*)')
         self.initstre = re.compile(r'initial:{}'.format(vectpatt))
         self.finstre = re.compile(r'final:{}'.format(vectpatt))
-        self.transre = re.compile(r'name:\s*(\w*)\s*input:\s*{0}\s*output:{0}\s*'.format(vectpatt))
+        self.transre = re.compile(r'name:\s*(\w*)\s*input:{0}\s*output:{0}'.format(vectpatt))
+        self.cachedir = cachedir #parsed domains are kept here, if given
 
     def loadFile(self, filename):
         print('Reading from ' + filename + '\n' + '-'*45)
 
-        try:        
-            with open(filename, 'r') as fl:
-                txt = fl.read()
+        try:
+            with open(filename, 'rb') as fl:
+                return self.loadBytes(fl.read())
 
-                #fetch preamble
-                typs = parser.fetchVector(self.typeslistre.search(txt).group(1))
-                inits = parser.strVectToNpArray(parser.fetchVector(self.initstre.search(txt).group(1)))
-                finst = parser.strVectToNpArray(parser.fetchVector(self.finstre.search(txt).group(1)))
+        except (ValueError, IOError) as e:
+            print("*Parsing error")
+            raise
 
-                #fetch actions
-                acts = [[act[0], parser.fetchNpArray(act[1]), parser.fetchNpArray(act[2])] for act in self.transre.findall(txt)]
+    def loadBytes(self, raw):
+        """Parses the contents of a domain file."""
+        cachefile = None
+        if self.cachedir is not None:
+            digest = hashlib.sha1(raw).hexdigest()
+            cachefile = os.path.join(self.cachedir, "{}-v{}.npz".format(digest, parser.cacheversion))
+            if os.path.exists(cachefile):
+                print("(cached in {})".format(cachefile))
+                return parser.loadCache(cachefile)
+
+        typs, inits, finst, names, PRE, EFF = self.tokenize(raw.decode())
+
+        if cachefile is not None:
+            parser.saveCache(cachefile, typs, inits, finst, names, PRE, EFF)
+
+        return parser.makeDomain(typs, inits, finst, names, PRE, EFF)
+
+    def tokenize(self, txt):
+        """One pass over the actions. Their vectors are collected as
+        strings and converted all at once, into preallocated PRE/EFF."""
+        typs = parser.fetchVector(self.typeslistre.search(txt).group(1))
+        inits = parser.strVectToNpArray(self.initstre.search(txt).group(1))
+        finst = parser.strVectToNpArray(self.finstre.search(txt).group(1))
+        acts = self.transre.findall(txt)
+
+        #for now, we don't allow nondeterminism
+        names, seen = [act[0] for act in acts], set()
+        for a in names:
+            if a in seen:
+                raise ValueError("non-deterministic action {}".format(a))
+            seen.add(a)
+
+        ntypes = len(inits)
+        PRE = np.zeros((len(names), ntypes), dtype = inits.dtype)
+        EFF = np.zeros((len(names), ntypes), dtype = inits.dtype)
+        if len(names) > 0:
+            flat = parser.strVectToNpArray(",".join([act[1] + "," + act[2] for act in acts]))
+            if len(flat) != 2 * len(names) * ntypes or len(finst) != ntypes:
+                raise ValueError("vectors of different lengths")
+            flat = flat.reshape(len(names), 2, ntypes)
+            PRE[:], EFF[:] = flat[:, 0], flat[:, 1]
+
+        return typs, inits, finst, names, PRE, EFF
 
-                #for now, we don't allow nondeterminism
-                actn = [act[0] for act in acts]
-                for a in actn:
-                    if actn.count(a) > 1:
-                        print("Non-deterministic action {}. Quitting.".format(a))
-                        sys.exit()
+    @classmethod
+    def makeDomain(cls, typs, inits, finst, names, PRE, EFF):
+        #the vectors of the actions are views of the rows of PRE and EFF
+        acts = list(map(list, zip(names, PRE, EFF)))
+        return planningdomain.simpleplanningdomain(typs, inits, finst, acts, matrices = (PRE, EFF))
 
-                return planningdomain.simpleplanningdomain(typs, inits, finst, acts)
+    @classmethod
+    def saveCache(cls, cachefile, typs, inits, finst, names, PRE, EFF):
+        if not os.path.isdir(os.path.dirname(cachefile)):
+            os.makedirs(os.path.dirname(cachefile))
+        #written aside and renamed, so that no half-written cache is read
+        tmpfile = cachefile + ".tmp.npz"
+        #the matrices are mostly small numbers, stored in the narrowest type
+        narrow = PRE.dtype
+        for t in [np.int8, np.int16, np.int32]:
+            if all([m.size == 0 or (np.iinfo(t).min <= m.min() and m.max() <= np.iinfo(t).max) for m in [PRE, EFF]]):
+                narrow = t
+                break
+        np.savez(tmpfile, types = np.array(typs), initial = inits, final = finst, \
+                 names = np.array(names, dtype = str), PRE = PRE.astype(narrow), EFF = EFF.astype(narrow))
+        os.replace(tmpfile, cachefile)
 
-        except (ValueError, IOError) as e:
-            print("*Parsing error")
-            raise
+    @classmethod
+    def loadCache(cls, cachefile):
+        with np.load(cachefile) as cache:
+            inits = cache["initial"]
+            return parser.makeDomain(cache["types"].tolist(), inits, cache["final"], cache["names"].tolist(), \
+                                     cache["PRE"].astype(inits.dtype), cache["EFF"].astype(inits.dtype))
 
     @classmethod
     def fetchVector(cls, strn):
@@ -57,6 +118,7 @@ class parser:
 
     @classmethod
     def strVectToNpArray(cls, stvec):
-        return np.array([int(i) for i in stvec])
-
-    
+        """Converts a comma separated string (or a list of strings) of ints."""
+        if not isinstance(stvec, str):
+            stvec = ",".join(stvec)
+        return np.fromstring(stvec, dtype = np.int64, sep = ",")
@@ -7,6 +7,7 @@
 from __future__ import print_function
 
 import sys
+import time
 import argparse
 import functools
 from z3 import *
@@ -22,55 +23,184 @@ def printPlan(mdl, allv):
     nonplanacts = [a for a in trueacts + dncacts]
     print("{{ {} }}".format(", ".join(nonplanacts)))
 
+def printCover(cover):
+    print("{{ {} }}".format(", ".join([str(a) for a in cover])))
+
+def setDeadline(slv, deadline):
+    """Bounds the next checks of slv by the time left until the deadline
+    (a time.time()); False once it has passed."""
+    left = deadline - time.time()
+    if left <= 0:
+        return False
+    if left < float('inf'):
+        slv.set("timeout", max(1, int(left * 1000)))
+    return True
+
+def enumerateAssignments(slv, allvars, maxp, deadline = float('inf')):
+    """Blocks each model with its full assignment. Stops after maxp
+    models or at the deadline; returns their number and whether
+    there are no more."""
+    andl = lambda x, y: "(and {} {})".format(x, y)
+
+    ctr = 0
+    while ctr < maxp:
+        if not setDeadline(slv, deadline):
+            return ctr, False
+        res = slv.check()
+        if res != sat:
+            return ctr, res == unsat
+        ctr += 1
+        model = slv.model()
+        print("{})".format(ctr), end = " ")
+        printPlan(model, allvars)
+
+        res = []
+        meindecls = {}
+        for d in model.decls():
+            meindecls[str(d)] = d
+            if is_true(model[d]):
+                res.append(str(d))
+            else:
+                res.append("(not {})".format(str(d)))
+
+        reduced = "(assert ( not {}))".format(functools.reduce(andl, res))
+        notclause = parse_smt2_string(reduced, decls = meindecls)
+        slv.add(notclause)
+
+    return ctr, False
+
+def enumerateMaximal(slv, allvars, maxp, deadline = float('inf')):
+    """Grows each model to a maximal set of true actions
+    and blocks all its subsets at once. There can be exponentially many
+    maximal covers, so it stops after maxp of them or at the deadline;
+    returns their number and whether there are no more."""
+
+    def trueSet(model):
+        #the actions missing from a model are not necessarily don't-care
+        return set([str(v) for v in allvars if is_true(model.eval(v, model_completion = True))])
+
+    ctr = 0
+    while ctr < maxp:
+        if not setDeadline(slv, deadline):
+            return ctr, False
+        res = slv.check()
+        if res != sat:
+            return ctr, res == unsat
+        ctr += 1
+        cover = trueSet(slv.model())
+
+        #ask for a strictly larger set, until there is none; the request
+        #is guarded by a fresh literal, retired afterwards
+        while len(cover) < len(allvars):
+            guard = FreshBool()
+            slv.add(Implies(guard, Or([v for v in allvars if str(v) not in cover])))
+            if not setDeadline(slv, deadline):
+                return ctr - 1, False
+            res = slv.check([v for v in allvars if str(v) in cover] + [guard])
+            if res == unknown:
+                #not known to be maximal, hence not printed
+                return ctr - 1, False
+            grown = res == sat
+            if grown:
+                cover = trueSet(slv.model())
+            slv.add(Not(guard))
+            if not grown:
+                break
+
+        print("{})".format(ctr), end = " ")
+        printCover([v for v in allvars if str(v) in cover])
+
+        #some action outside of the cover
+        slv.add(Or([v for v in allvars if str(v) not in cover]))
+
+    return ctr, False
+
+def buildFromDomain(fname, depth):
+    """Builds the formula of non-plans in-process, straight from the
+    oracle structure, without the SMT-lib text round-trip."""
+    from parser import simpleparser
+    from checker import checker
+
+    pd = simpleparser.parser().loadFile(fname).getQuotient()
+    check = checker.oracle(pd)
+    initnode = check.buildNonPlans(depth)
+    return check.getNonPlansInZ3(initnode)
+
+def solveAnytime(fname, depth, maxp):
+    """Solves the non-plans of the domain while they are being built,
+    reporting up to maxp new ones at each depth (see anytimesolver)."""
+    from parser import simpleparser
+    from checker import checker
+    from checker import anytime
+
+    pd = simpleparser.parser().loadFile(fname).getQuotient()
+    solver = anytime.anytimesolver(checker.oracle(pd), maxp)
+    solver.run(depth)
+    return solver
+
+
+#the default maxPlans of -x, see enumerateMaximal
+maxcovers = 1000
 
 if __name__ == "__main__":
     print("{:^45}".format("*** PlanBrowser ***"))
     print('-'*45)
 
-    optpar = argparse.ArgumentParser(description="""SMT (non) plan browser for SpaceCut. 
+    optpar = argparse.ArgumentParser(description="""SMT (non) plan browser for SpaceCut.
     For now, it simply prints out a cover of non-plans actions.""")
     optpar.add_argument('file', metavar='file', type=str, help='input file')
-    optpar.add_argument('maxp', metavar='maxPlans', type=int, help='maximal number of plans (default unbounded)', nargs='?')
+    optpar.add_argument('maxp', metavar='maxPlans', type=int, help='maximal number of plans (default unbounded, {} with -x)'.format(maxcovers), \
+                        nargs='?')
     optpar.add_argument("-m", "--simpForm", help='print simplified formula', action="store_true")
-                    
+    optpar.add_argument("-d", "--domain", help='the input file is a domain (.spt), build its non-plans in-process', \
+                        action="store_true")
+    optpar.add_argument("--depth", metavar='unwdepth', type=int, help='depth of unfolding, with -d (default unbounded)')
+    optpar.add_argument("-x", "--maximal", help="""print only maximal covers, blocking all their subsets. There can be
+                        exponentially many of them in the number of actions, hence at most maxPlans""", \
+                        action="store_true")
+    optpar.add_argument("-t", "--time-limit", metavar='SEC', type=float, help='stop enumerating after SEC seconds')
+    optpar.add_argument("-a", "--anytime", help="""with -d, solve while building: print up to maxPlans (default 1)
+                        new non-plans as each depth is reached""", action="store_true")
+
     args = optpar.parse_args()
 
-    try:
-        print("Reading {}".format(args.file))
-        form = simplify(parse_smt2_file(args.file))
-        maxp = args.maxp if args.maxp != None else float('inf')
+    if args.anytime:
+        if not args.domain:
+            print("--anytime needs a domain (-d). Quitting.")
+            sys.exit()
+        solver = solveAnytime(args.file, float("inf") if args.depth == None else args.depth, \
+                              args.maxp if args.maxp != None else 1)
+        if solver.first is not None:
+            print("{} non-plans, the first after {:.4f} sec.".format(solver.found, solver.first))
+        sys.exit()
 
-        slv = Solver()
+    try:
+        if args.domain:
+            form, allvars = buildFromDomain(args.file, float("inf") if args.depth == None else args.depth)
+        else:
+            print("Reading {}".format(args.file))
+            form = simplify(And([f for f in parse_smt2_file(args.file)]))
+            allvars = [k.n for k in get_vars(form)]
+        maxp = args.maxp if args.maxp != None else maxcovers if args.maximal else float('inf')
+        deadline = float('inf') if args.time_limit == None else time.time() + args.time_limit
+
+        slv = SolverFor("QF_FD") if args.maximal else Solver()
         slv.add(form)
 
-        allvars = get_vars(form)
-
         if args.simpForm:
             print('simplified formula:')
-            print(form)
-
-        andl = lambda x, y: "(and {} {})".format(x, y)
+            print(simplify(form) if args.domain else form)
 
-        ctr = 0
         print('Non-plans are subsets of:')
-        while slv.check() == sat and ctr < maxp:
-            ctr += 1
-            model = slv.model()
-            print("{})".format(ctr), end = " ")
-            printPlan(model, allvars)
-
-            res = []
-            meindecls = {}
-            for d in model.decls():
-                meindecls[str(d)] = d
-                if is_true(model[d]):
-                    res.append(str(d))
-                else:
-                    res.append("(not {})".format(str(d)))
-            
-            reduced = "(assert ( not {}))".format(functools.reduce(andl, res))
-            notclause = parse_smt2_string(reduced, decls = meindecls)
-            slv.add(notclause)
+        enumstart = time.time()
+        if args.maximal:
+            ctr, complete = enumerateMaximal(slv, allvars, maxp, deadline)
+        else:
+            ctr, complete = enumerateAssignments(slv, allvars, maxp, deadline)
+        enumtime = time.time() - enumstart
+        print("{} models in {:.4f} sec. ({:.1f} models/sec)".format(ctr, enumtime, ctr / max(enumtime, 1e-9)))
+        if not complete:
+            print("Stopped {}, there may be more.".format("after {} models".format(ctr) if ctr >= maxp else "at the time limit"))
 
     except:
         print("*SMT formula reading error")
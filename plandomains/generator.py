@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+
+import random
+import numpy as np
+from plandomains import planningdomain
+
+
+def generateDomain(ntypes, nactions, hdepth = 3, density = 0.3, seed = 0):
+    """A random monotone domain, shaped like the ontology benchmarks.
+    The types form a forest of hdepth levels and an object of a type
+    counts for the type and all its ancestors. Each action consumes some
+    objects and produces at least one; the number of further objects in
+    its effect (and precondition) grows with density. Every fourth action,
+    on average, needs nothing. The goal is an object of a deepest type."""
+    rnd = random.Random(seed)
+    hdepth = max(1, min(hdepth, ntypes))
+
+    #types of the i-th level are the i-th block of the type vector
+    levels = [list(range(l * ntypes // hdepth, (l + 1) * ntypes // hdepth)) for l in range(hdepth)]
+    parent = {}
+    for l in range(1, hdepth):
+        for t in levels[l]:
+            parent[t] = rnd.choice(levels[l - 1])
+
+    def objectVector(t):
+        vec = np.zeros(ntypes, dtype = np.int64)
+        while True:
+            vec[t] += 1
+            if t not in parent:
+                return vec
+            t = parent[t]
+
+    def objectsVector(first):
+        #the first object, then one more with probability density each time
+        vec = objectVector(first)
+        while rnd.random() < density and vec.sum() < ntypes:
+            vec += objectVector(rnd.randrange(ntypes))
+        return vec
+
+    actions = []
+    for i in range(nactions):
+        pre = np.zeros(ntypes, dtype = np.int64) if rnd.random() < 0.25 else objectsVector(rnd.randrange(ntypes))
+        eff = objectsVector(rnd.randrange(ntypes))
+        actions.append(["act{}".format(i), pre, eff])
+
+    typelist = ["Type{}".format(t) for t in range(ntypes)]
+    initvec = np.zeros(ntypes, dtype = np.int64)
+    finalvec = objectVector(rnd.choice(levels[-1]))
+    return planningdomain.simpleplanningdomain(typelist, initvec, finalvec, actions)
+
+def writeDomain(pldom, outf):
+    """Writes the domain in the simpleparser (.spt) format."""
+    vect = lambda v: "({})".format(", ".join([str(x) for x in v.tolist()]))
+    outf.write("types:\n{}\n\ninitial:\n{}\n\nfinal:\n{}\n\ntransitions:\n".format( \
+        ", ".join(pldom.typelist), vect(pldom.initvec), vect(pldom.finalvec)))
+    for act in pldom.actions:
+        outf.write("\nname: {}\n\ninput:\n{}\n\noutput:\n{}\n".format(act[0], vect(act[1]), vect(act[2])))
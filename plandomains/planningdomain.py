@@ -4,18 +4,25 @@
 
 
 import numpy as np
+import heapq
+import itertools
 
 
 class simpleplanningdomain:
     """The domain for linear planning."""
 
-    def __init__(self, typelist, initvec, finalvec, actions):
+    #the enabled actions are found from the nonzero entries of PRE only
+    #in domains at least this large and at most this dense
+    sparsesize = 4096
+    sparsedensity = 0.1
+
+    def __init__(self, typelist, initvec, finalvec, actions, actclasses = None, matrices = None):
         self.typelist = typelist
         self.initvec = initvec
         self.finalvec = finalvec
         self.actions = actions        
-        self.recomputevmax()
-        self.initcopy = None
+        self.buildMatrices(matrices)
+        self.buildOrigin()
 
         #some redundancy here
         self.actNameToAction = {}
@@ -23,86 +30,282 @@ class simpleplanningdomain:
             self.actNameToAction[a[0]] = a
         self.actnames = self.actNameToAction.keys()
 
+        #action name -> the names of the concrete actions it stands for,
+        #more than one only in a quotient domain (see getQuotient);
+        #None if each action stands for itself
+        self.actclasses = actclasses
+
         #access only after running getHsequence
         self.kmax = None
         self.kgoal = None
         self.hsequence = None #fireable actions
         self.usequence = None #useless actions
+        self.hlevels = None #fireable actions, as row indices
+
+        #action index over the H-sequence: the i-th bit of an
+        #action set (a plain int) stands for the i-th action
+        self.hactnames = None
+        self.hactbits = None
+        self.hactrows = None #action index -> row of PRE/EFF
+        self.hactclasses = None #action index -> names of the concrete actions
+        self.typecovers = None #type index -> bitmask of producing actions
+        self.relevantacts = None #bitmask of the actions that can feed the goal, see getRelevantActs
+
+    def buildActionIndex(self):
+        """Fixes the order of the (non-useless) actions
+        used in the bitmask representation of action sets."""
+        self.hactnames = [a[0] for a in sum(self.hsequence, [])]
+        self.hactbits = {}
+        for i in range(len(self.hactnames)):
+            self.hactbits[self.hactnames[i]] = i
+        self.hactrows = np.concatenate([np.array([], dtype = int)] + self.hlevels)
+        self.hactclasses = [self.getActClass(a) for a in self.hactnames]
+        self.relevantacts = None
+        self.buildCoverIndex()
+
+    def buildCoverIndex(self):
+        """For each type i, the set (bitmask) of the indexed actions whose
+        effect covers the i-th unit vector, i.e. the actions producing i."""
+        eff = self.EFF[self.hactrows]
+        covers = np.all(eff >= 0, axis = 1)[:, None] & (eff >= 1)
+        self.typecovers = [0] * len(self.initvec)
+        #over the (few) covered types of each action only
+        for i, j in zip(*[ix.tolist() for ix in np.nonzero(covers.T)]):
+            self.typecovers[i] |= 1 << j
+
+    def getRelevantActs(self):
+        """Backward regression from finalvec over the indexed actions, run
+        once, on the first call. An action is relevant if it produces a type
+        needed for the goal, directly or through the preconditions of other
+        relevant actions, and it is not redundant (i.e. its precondition is
+        not already above the goal). Returns them as a bitmask.
+        The meets of the non-plans only follow the actions covering their
+        type, so apart from the redundant ones these are the actions they
+        reach anyway; restricting the non-plans to them mostly sets the
+        others to false in the formula."""
+        if self.relevantacts is not None:
+            return self.relevantacts
+
+        need = self.originfinal
+        goalsupport = self.targetsupport[self.goaltarget]
+        #a worklist of the needed types, each one visited once
+        needed, work, relevant = set(goalsupport), list(goalsupport), 0
+        while work:
+            for a in self.maskToActIds(self.typecovers[work.pop()] & ~relevant):
+                row = self.hactrows[a]
+                if len(goalsupport) > 0 and np.all(self.originPRE[row] >= need):
+                    continue #redundant
+                relevant |= 1 << a
+                for j in self.targetsupport[self.rowtargets[row]]:
+                    if j not in needed:
+                        needed.add(j)
+                        work.append(j)
+        self.relevantacts = relevant
+        return relevant
+
+    def getGoalDepth(self):
+        """A lower bound on the unfolding depth (join and meet levels)
+        needed to build the non-plans of the goal completely. A type takes
+        one level more than the deepest precondition type of its cheapest
+        producer; the levels are settled in increasing order, from a heap.
+        It is reported to choose the depth; the non-plans are not cut by it."""
+        producing = [[] for _ in range(len(self.hactnames))] #action index -> the types it covers
+        for i, mask in enumerate(self.typecovers):
+            for a in self.maskToActIds(mask):
+                producing[a].append(i)
+        users = [[] for _ in range(len(self.initvec))] #type index -> the actions needing it
+        waiting = [] #action index -> its precondition types not settled yet
+        for a in range(len(self.hactnames)):
+            support = self.targetsupport[self.rowtargets[self.hactrows[a]]]
+            for j in support:
+                users[j].append(a)
+            waiting.append(len(support))
+
+        typedepth = [float('inf')] * len(self.initvec)
+        heap = [(1, a) for a in range(len(self.hactnames)) if waiting[a] == 0]
+        while heap:
+            d, a = heapq.heappop(heap)
+            for i in producing[a]:
+                if d < typedepth[i]:
+                    typedepth[i] = d
+                    for b in users[i]:
+                        waiting[b] -= 1
+                        if waiting[b] == 0:
+                            #its precondition types are settled, the last one at d
+                            heapq.heappush(heap, (d + 1, b))
+        return 2 * max([typedepth[i] for i in np.flatnonzero(self.finalvec > self.initvec)] + [0])
+
+    def actsToMask(self, actnames):
+        mask = 0
+        for a in actnames:
+            mask |= 1 << self.hactbits[a]
+        return mask
+
+    @classmethod
+    def maskToActIds(cls, mask):
+        """Indices of the actions in the set, in the index order."""
+        bits = bin(mask)
+        if 8 * bits.count("1") >= len(bits):
+            #dense sets are read off the binary digits, least significant first
+            return [i for i, c in enumerate(bits[:1:-1]) if c == "1"]
+        ids = []
+        while mask:
+            low = mask & -mask
+            ids.append(low.bit_length() - 1)
+            mask ^= low
+        return ids
+
+    def maskToActs(self, mask):
+        return [self.hactnames[i] for i in self.maskToActIds(mask)]
+
+    def maskToMembers(self, mask):
+        """The names of the concrete actions in the set, with the
+        classes of a quotient domain expanded."""
+        return list(itertools.chain.from_iterable([self.hactclasses[i] for i in self.maskToActIds(mask)]))
+
+    def getActClass(self, actname):
+        """The names of the concrete actions the action stands for."""
+        if self.actclasses is None:
+            return [actname]
+        return self.actclasses[actname]
+
+    def getQuotient(self):
+        """Returns the domain with the actions of identical precondition
+        and effect collapsed into one, named after the first of them.
+        Each such action stands for its whole class, see actclasses."""
+        reps, classes = {}, {}
+        for i in range(len(self.actions)):
+            key = (self.PRE[i].tobytes(), self.EFF[i].tobytes())
+            if key not in reps:
+                reps[key] = i
+                classes[self.actions[i][0]] = []
+            classes[self.actions[reps[key]][0]] += self.getActClass(self.actions[i][0])
+
+        qacts = [[self.actions[i][0], np.copy(self.PRE[i]), np.copy(self.EFF[i])] for i in sorted(reps.values())]
+        return simpleplanningdomain(self.typelist, np.copy(self.initvec), np.copy(self.finalvec), qacts, classes)
+
+    def countConcreteActs(self):
+        if self.actclasses is None:
+            return len(self.actions)
+        return sum([len(c) for c in self.actclasses.values()])
+
+    def getReductionFactor(self):
+        """How many concrete actions each action stands for, on average."""
+        return self.countConcreteActs() / float(max(1, len(self.actions)))
+
+    def buildMatrices(self, matrices = None):
+        """Stores preconditions and effects as dense (actions x types)
+        matrices PRE and EFF. The vectors of the actions become views
+        of their rows, so both stay in sync. The (PRE, EFF) pair can be
+        given, if the actions are already views of its rows."""
+        if matrices is not None:
+            self.PRE, self.EFF = matrices
+            return
+
+        ntypes = len(self.initvec)
+        self.PRE = np.zeros((len(self.actions), ntypes), dtype = self.initvec.dtype)
+        self.EFF = np.zeros((len(self.actions), ntypes), dtype = self.initvec.dtype)
+
+        for i in range(len(self.actions)):
+            act = self.actions[i]
+            self.PRE[i], self.EFF[i] = act[1], act[2]
+            act[1], act[2] = self.PRE[i], self.EFF[i]
 
     def getAction(self, actName):
         return self.actNameToAction[actName]
 
-    def moveToOrigin(self):
-        if self.initcopy is None:
-            self.initcopy = np.copy(self.initvec)
-            self.initvec -= self.initcopy
-            self.finalvec -= self.initcopy
-
-            for act in self.actions:
-                act[1] -= self.initcopy
-            self.recomputevmax()
-
-    def restoreOrigin(self):
-        if self.initcopy is not None:
-            self.initvec, self.initcopy = self.initcopy, None
-            self.finalvec += self.initvec
-
-            for act in self.actions:
-                act[1] += self.initvec
-            self.recomputevmax()
-
-    def recomputevmax(self):
-        self.vmax = max(max([max(i[1]) for i in self.actions]), max(self.initvec), max(self.finalvec))
-
-    def getEnabledActs(self, wrld, actset):
-        enacts = []
-
-        for act in actset:
-            if min(wrld >= act[1]):
-                enacts.append(act)
-
-        return enacts
+    def buildOrigin(self):
+        """The preconditions and the goal with the initial world moved to
+        the origin, as read-only copies: the domain itself is never shifted,
+        so that it can be shared (e.g. by the requests of spaceCutServer)."""
+        self.originPRE = self.PRE - self.initvec
+        self.originfinal = self.finalvec - self.initvec
+        for v in [self.originPRE, self.originfinal]:
+            v.setflags(write = False)
+        self.vmax = max(self.originPRE.max(initial = 0), self.originfinal.max(initial = 0))
+
+        #the nonzero entries of originPRE, (row, column, value)
+        self.prerows, self.precols = np.nonzero(self.originPRE)
+        self.prevals = self.originPRE[self.prerows, self.precols]
+        self.sparse = self.originPRE.size >= simpleplanningdomain.sparsesize and \
+            len(self.prevals) <= simpleplanningdomain.sparsedensity * self.originPRE.size
+        self.buildTargets()
+
+    def buildTargets(self):
+        """The targets of the join nodes are the distinct (shifted)
+        preconditions, and the goal last, numbered. Each one is kept
+        as its support: the types it needs, i.e. the meets below."""
+        self.rowtargets = [] #row of PRE -> target
+        self.targetrows = [] #target -> the first row of PRE with it, -1 for the goal
+        seen = {}
+        for i in range(len(self.actions)):
+            key = self.originPRE[i].tobytes()
+            if key not in seen:
+                seen[key] = len(self.targetrows)
+                self.targetrows.append(i)
+            self.rowtargets.append(seen[key])
+        self.goaltarget = len(self.targetrows)
+        self.targetrows.append(-1)
+
+        rows, cols = np.nonzero(self.originPRE[self.targetrows[:-1]] > 0)
+        bounds = np.cumsum(np.bincount(rows, minlength = self.goaltarget))[:-1]
+        self.targetsupport = [c.tolist() for c in np.split(cols, bounds)] if self.goaltarget > 0 else []
+        self.targetsupport.append(np.flatnonzero(self.originfinal > 0).tolist())
+
+    def getTargetVector(self, target):
+        """The (shifted) vector of the join target."""
+        if target == self.goaltarget:
+            return self.originfinal
+        return self.originPRE[self.targetrows[target]]
+
+    def getEnabledMask(self, wrld, remaining):
+        """Boolean mask of the remaining actions enabled by wrld,
+        given relative to the initial world."""
+        if self.sparse and wrld.min(initial = 0) >= 0:
+            #a nonnegative world can only be short of the nonzero entries
+            short = self.prerows[self.prevals > wrld[self.precols]]
+            return remaining & (np.bincount(short, minlength = len(self.actions)) == 0)
+        return remaining & np.all(self.originPRE <= wrld, axis = 1)
     
     def getHsequence(self):
         """Builds the H-sequence."""
 
-        self.moveToOrigin()
-
         usefulActs = []
-        rest = []
 
-        #actions enabled by the initial world
-        curr = self.getEnabledActs(self.initvec, self.actions)
-        rest = self.actions[:]
-        usefulActs.append(curr)
-        greedyfire = 0
+        #actions enabled by the initial world (the origin)
+        rest = np.ones(len(self.actions), dtype = bool)
+        greedyfire = np.zeros_like(self.initvec)
+        curr = self.getEnabledMask(greedyfire, rest)
+        usefulActs.append(np.flatnonzero(curr))
         self.kgoal, depth, foundkgoal = float('inf'), 0, False
 
         if min(self.initvec >= self.finalvec):
             self.kgoal, foundkgoal = -1, True
 
         while True:
-            rest = [a for a in rest if a not in curr]
+            rest &= ~curr
             #fire all actions from already enabled (curr and earlier)
-            greedyfire += self.vmax * sum([act[2] for act in curr])
+            greedyfire += self.vmax * self.EFF[curr].sum(axis = 0)
 
-            if min(greedyfire >= self.finalvec) and not foundkgoal:
+            if min(greedyfire >= self.originfinal) and not foundkgoal:
                 self.kgoal, foundkgoal = depth, True
             else:
                 depth += 1
 
-            curr = self.getEnabledActs(greedyfire, rest)
+            curr = self.getEnabledMask(greedyfire, rest)
 
-            if len(curr) == 0:
+            if not curr.any():
                 break
 
-            usefulActs.append(curr)
+            usefulActs.append(np.flatnonzero(curr))
         
         self.kmax = len(usefulActs) - 1
-        self.restoreOrigin()
 
-        self.hsequence = usefulActs
-        self.usequence = rest
+        #levels of the H-sequence as rows of PRE/EFF
+        self.hlevels = usefulActs
+        self.hsequence = [[self.actions[i] for i in lvl] for lvl in usefulActs]
+        self.usequence = [self.actions[i] for i in np.flatnonzero(rest)]
+        self.buildActionIndex()
 
     def reportSequence(self):
 
@@ -119,7 +322,7 @@ class simpleplanningdomain:
         for s in self.hsequence:
             print("-(H" + str(ctr) + ")-")
             for a in s:
-                print(a[0])
+                print(self.classDesc(a[0]))
             ctr += 1
         print("(kgoal = {}, kmax = {})".format(self.kgoal, ctr - 1))
 
@@ -130,15 +333,10 @@ class simpleplanningdomain:
         if self.kgoal < float('inf'):
             #redundant actions R and possibly useful T
             print('-' * 45 + "\nRedundant, but not useless actions:")    
-            nongreedyacts = sum(self.hsequence[self.kgoal + 1:], [])
-            rnul, terrainc = [], []
-    
-            for act in nongreedyacts:
-
-                if min(self.finalvec <= act[1]):
-                    rnul.append(act)
-                else:
-                    terrainc.append(act)
+            nongreedyacts = np.concatenate([np.array([], dtype = int)] + self.hlevels[self.kgoal + 1:])
+            coversfinal = np.all(self.PRE[nongreedyacts] >= self.finalvec, axis = 1)
+            rnul = [self.actions[i] for i in nongreedyacts[coversfinal]]
+            terrainc = [self.actions[i] for i in nongreedyacts[~coversfinal]]
 
             self.displayacts(rnul)
 
@@ -161,11 +359,16 @@ class simpleplanningdomain:
     def actiondesc(cls, act):
         return " act: {0}\n pre: {1}\n eff: {2}".format(act[0], list(act[1]), list(act[2]))
 
-    @classmethod
-    def displayacts(cls, acts):
+    def classDesc(self, actname):
+        members = self.getActClass(actname)
+        if len(members) == 1:
+            return actname
+        return "{} (= {})".format(actname, ", ".join(members[1:]))
+
+    def displayacts(self, acts):
         if len(acts) == 0:
             print("none found")
         else:
             for a in acts:
-                print(a[0])
+                print(self.classDesc(a[0]))
 
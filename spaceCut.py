@@ -4,18 +4,24 @@
 
 from parser import simpleparser
 from checker import checker
+from checker import metrics
 import argparse
-import time
+import os
 import sys
 
 class mytimr:
-    """Rudimentary, measures real, not process time."""
+    """Reports the real time of a phase; all the measurements
+    of the phase are recorded in the metrics."""
 
-    def start(self):
-        self.timeNow = time.time()
+    def __init__(self, mets):
+        self.mets = mets
+
+    def start(self, name):
+        self.name = name
+        self.mets.startPhase(name)
     
     def timeRep(self):
-        print("({0:.4f} sec.)".format(time.time() - self.timeNow))
+        print("({0:.4f} sec.)".format(self.mets.endPhase(self.name)["wall"]))
 
 if __name__ == "__main__":
     print("{:^45}".format("*** SpaceCut pruning tool ***"))
@@ -26,46 +32,150 @@ if __name__ == "__main__":
     optpar.add_argument('SATfile', metavar='SATfile', type=str, help='SAT output file')
     optpar.add_argument('depth', metavar='unwdepth', type=int, help='depth of unfolding', nargs='?')
     optpar.add_argument('dotfile', metavar='dotfile', type=str, help='dot file to save output', nargs='?')
+    optpar.add_argument('-s', '--share', help='name each repeated subformula once, with define-fun', action="store_true")
+    optpar.add_argument('-c', '--dimacs', metavar='CNFfile', type=str, \
+                        help='also save the formula as DIMACS CNF (action indices in CNFfile.map)')
+    optpar.add_argument('-j', '--jobs', metavar='N', type=int, default=1, \
+                        help='experimental: expand the large frontiers in N processes (default 1). The successors are '
+                             'still merged in this process, which takes about as long as a 1-process build, so it is '
+                             'not faster; --metrics-json records the share spent in the processes')
+    optpar.add_argument('--checkpoint', metavar='CHKfile', type=str, help='save the built non-plans to CHKfile')
+    optpar.add_argument('--resume', metavar='CHKfile', type=str, \
+                        help='resume the non-plans saved in CHKfile and unfold them up to unwdepth')
+    optpar.add_argument('--cache', metavar='DIR', type=str, \
+                        help='keep the parsed domains in DIR, keyed by the hash of the file, and reuse them')
+    optpar.add_argument('--no-classes', help='do not collapse the actions with identical precondition and effect', \
+                        action="store_true")
+    optpar.add_argument('--memory-budget', metavar='MB', type=float, \
+                        help='spill the completed levels of non-plans to disk once they take more than MB megabytes')
+    optpar.add_argument('-r', '--relevant', help='write the formula over the actions that can feed the goal only: the '
+                        'one without -r with the other actions set to false. It has fewer variables but mostly '
+                        'the same nodes, and it no longer holds for the sets whose only actions cannot feed the goal', \
+                        action="store_true")
+    optpar.add_argument('--metrics-json', metavar='JSONfile', type=str, \
+                        help='save the time, memory and output size of each phase, and the unfolding levels')
+    optpar.add_argument('--tracemalloc', help='also record the peak of Python allocations of each phase', \
+                        action="store_true")
+    optpar.add_argument('--profile', metavar='PROFfile', type=str, help='profile the run with cProfile, save to PROFfile')
+    optpar.add_argument('--dot-depth', metavar='D', type=int, help='save the nodes of dotfile (and JSONfile) down to depth D only')
+    optpar.add_argument('--dot-max-nodes', metavar='N', type=int, help='save at most N nodes in dotfile (and JSONfile)')
+    optpar.add_argument('--dot-fold', help='in dotfile, draw the edges to the nodes drawn before as references to them', \
+                        action="store_true")
+    optpar.add_argument('--dot-full', help='in dotfile, label the nodes with all their actions, not just their number', \
+                        action="store_true")
+    optpar.add_argument('--json', metavar='JSONfile', type=str, help='also save the non-plans as a compact JSON node list')
+    optpar.add_argument('--count', help='compile the non-plans into a ZDD and count them exactly', action="store_true")
+    optpar.add_argument('--sample', metavar='K', type=int, help='also print K non-plans drawn uniformly from the ZDD')
 
     args = optpar.parse_args()
-    prs = simpleparser.parser()
+    prs = simpleparser.parser(args.cache)
+
+    mets = metrics.metrics(args.tracemalloc)
+    if args.profile != None:
+        mets.startProfile()
 
-    tt = mytimr()
-    tt.start()
-    pd = prs.loadFile(args.file)
+    tt = mytimr(mets)
+    tt.start("parse")
+    try:
+        pd = prs.loadFile(args.file)
+    except ValueError as e:
+        print("{}. Quitting.".format(e))
+        sys.exit(1)
     tt.timeRep()
 
+    if not args.no_classes:
+        print("\n{:^45}".format("--- Collapsing equivalent actions ---"))
+        tt.start("classes")
+        pd = pd.getQuotient()
+        tt.timeRep()
+        print("{} actions in {} classes (reduction factor {:.2f}).".format( \
+            pd.countConcreteActs(), len(pd.actions), pd.getReductionFactor()))
+
     print("\n{:^45}".format("--- Computing H - sequence ---"))
-    tt.start()
+    tt.start("hsequence")
     pd.reportSequence()
     tt.timeRep()
+    if args.relevant:
+        print("{} of {} actions can feed the goal.".format(len(pd.maskToActIds(pd.getRelevantActs())), len(pd.hactnames)))
+    if args.depth != None:
+        #only reported, the build is not cut by it
+        print("Complete non-plans need depth >= {}.".format(pd.getGoalDepth()))
 
     dpth = float("inf") if args.depth == None else args.depth
 
     print("\n{:^45}\n{:^45}".format("--- Building full tree of non-plans ---", \
                                     "--- (with useless actions removed) ---"))
-    tt.start()
+    tt.start("build")
     check = checker.oracle(pd)
-    initnode = check.buildNonPlans(dpth)
+    check.metrics = mets
+    if args.memory_budget != None:
+        check.setMemoryBudget(args.memory_budget)
+    if args.resume != None:
+        check.loadCheckpoint(args.resume)
+        initnode = check.deepen(dpth - check.depth, args.jobs)
+    else:
+        initnode = check.buildNonPlans(dpth, args.jobs, args.relevant)
+    check.closePool()
     tt.timeRep()
 
+    if args.checkpoint != None:
+        check.saveCheckpoint(args.checkpoint)
+        print("Checkpoint saved in {0}.".format(args.checkpoint))
+
     if args.dotfile != None:
         print("\n{:^45}".format("--- Saving tree ---"))
-        tt.start()
-        check.dumpNonPlansInDot(args.dotfile)
+        tt.start("dot")
+        check.dumpNonPlansInDot(args.dotfile, args.dot_depth, args.dot_max_nodes, args.dot_fold, args.dot_full)
         tt.timeRep()
+        mets.setBytes("dot", os.path.getsize(args.dotfile))
         print("Saved in {0}. To convert to pdf use: \ndot {0} -Tpdf -o {0}.pdf".format(args.dotfile))
 
+    if args.json != None:
+        print("\n{:^45}".format("--- Saving node list ---"))
+        tt.start("json")
+        check.dumpNonPlansInJSON(args.json, args.dot_depth, args.dot_max_nodes)
+        tt.timeRep()
+        mets.setBytes("json", os.path.getsize(args.json))
+        print("Saved in {0}.".format(args.json))
+
     print("\n{:^45}".format("--- Saving SAT formula ---"))
-    tt.start()
-    satf = open(args.SATfile, 'w')
-    satf.write(check.getActionSMTdefns(initnode))
-    satf.write("\n(assert ")
-    satf.write(check.dumpNonPlansInSAT(initnode))
-    satf.write(")")
+    tt.start("sat")
+    with open(args.SATfile, 'w') as satf:
+        check.writeSMT(initnode, satf, args.share)
     tt.timeRep()
+    mets.setBytes("sat", os.path.getsize(args.SATfile))
     print("Saved in {0}.".format(args.SATfile))
 
+    if args.dimacs != None:
+        print("\n{:^45}".format("--- Saving CNF formula ---"))
+        tt.start("dimacs")
+        with open(args.dimacs, 'w') as cnff, open(args.dimacs + ".map", 'w') as mapf:
+            check.writeNonPlansInDIMACS(initnode, cnff, mapf)
+        tt.timeRep()
+        mets.setBytes("dimacs", os.path.getsize(args.dimacs))
+        print("Saved in {0}, variables in {0}.map.".format(args.dimacs))
+
+    if args.count or args.sample != None:
+        print("\n{:^45}".format("--- Compiling non-plans into ZDD ---"))
+        tt.start("zdd")
+        dd, root, actnames = check.getNonPlansInZDD(initnode)
+        tt.timeRep()
+        print("{} ZDD nodes, {} non-plans over {} actions.".format(dd.size(root), dd.count(root), len(actnames)))
+        for i in range(args.sample if args.sample != None else 0):
+            if root == 0:
+                break
+            print("{}) {{ {} }}".format(i + 1, ", ".join([actnames[v] for v in dd.sample(root)])))
+
+    if args.profile != None:
+        mets.stopProfile(args.profile)
+        print("\nProfile saved in {0}. To view use: \npython -m pstats {0}".format(args.profile))
+
+    if args.metrics_json != None:
+        print("\n{:^45}".format("--- Metrics ---"))
+        print(mets.report())
+        mets.saveJSON(args.metrics_json)
+        print("Saved in {0}.".format(args.metrics_json))
+
     print("\nAll done.")
 
 
@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+from parser import simpleparser
+from checker import checker
+from checker import metrics
+import argparse
+import contextlib
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tarfile
+import time
+
+#the phases of a run, in order
+phases = ["parse", "hsequence", "build", "sat"]
+
+def listDomains(source):
+    """The (name, size, location) of the .spt domains in a directory,
+    a tarball or matching a glob. The location is a path or an (archive,
+    member) pair, the name is relative to the directory or archive."""
+    if os.path.isdir(source):
+        doms = []
+        for root, dirs, files in os.walk(source):
+            for f in files:
+                if f.endswith(".spt"):
+                    path = os.path.join(root, f)
+                    doms.append((os.path.relpath(path, source), os.path.getsize(path), path))
+        return doms
+
+    if os.path.isfile(source) and tarfile.is_tarfile(source):
+        doms, seen = [], set()
+        with tarfile.open(source) as tarf:
+            for m in tarf.getmembers():
+                if not m.isfile() or not m.name.endswith(".spt"):
+                    continue
+                name = safeName(m.name)
+                if name is None or name in seen:
+                    #the outputs are named after the member, keep them in outdir
+                    print("Skipping {}: absolute, outside the archive or repeated.".format(m.name))
+                    continue
+                seen.add(name)
+                doms.append((name, m.size, (source, m.name)))
+        return doms
+
+    #named relative to the deepest directory holding all the matches
+    paths = [os.path.abspath(p) for p in glob.glob(source) if os.path.isfile(p)]
+    if len(paths) == 0:
+        return []
+    base = os.path.commonpath([os.path.dirname(p) for p in paths])
+    return [(os.path.relpath(p, base), os.path.getsize(p), p) for p in paths]
+
+def safeName(name):
+    """The archive member's name as a relative path that stays under
+    the output directory, None if it is absolute or goes up with .."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if name.startswith(("/", "\\")) or ".." in parts or len(parts) == 0:
+        return None
+    return os.path.join(*parts)
+
+def readDomain(location):
+    if isinstance(location, tuple):
+        #read from the archive, not extracted
+        with tarfile.open(location[0]) as tarf:
+            return tarf.extractfile(location[1]).read()
+    with open(location, 'rb') as fl:
+        return fl.read()
+
+def runDomain(task, conn):
+    """Runs in a fresh process: builds the non-plans of one domain and
+    saves them, logging to the .log file next to the outputs. Sends back
+    the status and the measurements."""
+    name, location, outbase, opts = task
+    if opts["memory"] is not None:
+        #the cap is on the address space, shared libraries included
+        resource.setrlimit(resource.RLIMIT_AS, (opts["memory"], opts["memory"]))
+
+    timr = metrics.metrics()
+    res = {"domain": name, "status": "ok"}
+    with open(outbase + ".log", 'w') as logf, contextlib.redirect_stdout(logf):
+        try:
+            with timr.phase("parse"):
+                pd = simpleparser.parser(opts["cache"]).loadBytes(readDomain(location))
+                if opts["classes"]:
+                    pd = pd.getQuotient()
+
+            with timr.phase("hsequence"):
+                pd.reportSequence()
+
+            with timr.phase("build"):
+                check = checker.oracle(pd)
+                check.metrics = timr
+                initnode = check.buildNonPlans(opts["depth"], 1, opts["relevant"])
+
+            with timr.phase("sat"):
+                with open(outbase + ".smt", 'w') as satf:
+                    check.writeSMT(initnode, satf, opts["share"])
+                if opts["dimacs"]:
+                    with open(outbase + ".cnf", 'w') as cnff, open(outbase + ".cnf.map", 'w') as mapf:
+                        check.writeNonPlansInDIMACS(initnode, cnff, mapf)
+
+            res.update({"actions": pd.countConcreteActs(), "uniquenodes": len(check.utable)})
+        except MemoryError:
+            res["status"] = "memory"
+        except (Exception, SystemExit) as e:
+            res["status"] = "error"
+            res["error"] = "{}: {}".format(type(e).__name__, e)
+
+    res["phases"] = dict([(p, timr.phases[p]["cpu"]) for p in timr.order if "peakrsskb" in timr.phases[p]])
+    res["peakrsskb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    conn.send(res)
+    conn.close()
+
+def runBatch(tasks, jobs, timeout):
+    """Runs the tasks in at most jobs processes at once, in the given
+    order. A run over timeout seconds is killed. Yields the results
+    as the runs finish."""
+    pending, running = list(tasks), []
+    while pending or running:
+        while pending and len(running) < jobs:
+            task = pending.pop(0)
+            recv, send = multiprocessing.Pipe(False)
+            proc = multiprocessing.Process(target = runDomain, args = (task, send))
+            proc.start()
+            send.close()
+            running.append((task, proc, recv, time.time()))
+
+        time.sleep(0.05)
+        for run in list(running):
+            task, proc, recv, start = run
+            res = None
+            if recv.poll():
+                res = recv.recv()
+            elif not proc.is_alive():
+                #killed without a word, e.g. by the kernel
+                res = {"domain": task[0], "status": "crashed", "error": "exit code {}".format(proc.exitcode)}
+            elif timeout is not None and time.time() - start > timeout:
+                proc.kill()
+                res = {"domain": task[0], "status": "timeout"}
+            if res is None:
+                continue
+
+            proc.join()
+            recv.close()
+            running.remove(run)
+            res["seconds"] = time.time() - start
+            yield res
+
+def printSummary(results):
+    print("{:<20}{:>8}".format("domain", "status") + "".join(["{:>10}".format(p) for p in phases]) + \
+          "{:>10}{:>10}{:>10}".format("total s", "nodes", "RSS MB"))
+    for r in results:
+        print("{:<20}{:>8}".format(r["domain"], r["status"]) + \
+              "".join(["{:>10.3f}".format(r["phases"][p]) if p in r.get("phases", {}) else "{:>10}".format("-") for p in phases]) + \
+              "{:>10.3f}{:>10}".format(r["seconds"], r.get("uniquenodes", "-")) + \
+              ("{:>10.1f}".format(r["peakrsskb"] / 1024.0) if "peakrsskb" in r else "{:>10}".format("-")))
+
+
+if __name__ == "__main__":
+    print("{:^45}".format("*** SpaceCut batch ***"))
+    print('-'*45)
+
+    optpar = argparse.ArgumentParser(description='Runs SpaceCut over many domains in a pool of processes.')
+    optpar.add_argument('source', metavar='source', type=str, \
+                        help='directory, glob (quoted) or tarball of .spt domains; tarballs are read in place')
+    optpar.add_argument('outdir', metavar='outdir', type=str, \
+                        help='directory of the outputs: a .smt formula and a .log per domain, and summary.json')
+    optpar.add_argument('depth', metavar='unwdepth', type=int, help='depth of unfolding', nargs='?')
+    optpar.add_argument('-j', '--jobs', metavar='N', type=int, default=multiprocessing.cpu_count(), \
+                        help='run N domains at once (default: the number of CPUs)')
+    optpar.add_argument('-t', '--timeout', metavar='SEC', type=float, help='kill a run after SEC seconds')
+    optpar.add_argument('-m', '--memory', metavar='MB', type=float, \
+                        help='cap the address space of a run at MB megabytes')
+    optpar.add_argument('-s', '--share', help='name each repeated subformula once, with define-fun', action="store_true")
+    optpar.add_argument('-c', '--dimacs', help='also save the formulas as DIMACS CNF', action="store_true")
+    optpar.add_argument('-r', '--relevant', help='over the actions that can feed the goal only, the others set to false (see spaceCut.py -r)', \
+                        action="store_true")
+    optpar.add_argument('--no-classes', help='do not collapse the equivalent actions', action="store_true")
+    optpar.add_argument('--cache', metavar='DIR', type=str, help='keep the parsed domains in DIR, keyed by their hash')
+
+    args = optpar.parse_args()
+    domains = listDomains(args.source)
+    if len(domains) == 0:
+        print("No .spt domains in {}. Quitting.".format(args.source))
+        sys.exit(1)
+
+    opts = {"depth": float("inf") if args.depth == None else args.depth, "share": args.share, "dimacs": args.dimacs,
+            "relevant": args.relevant, "classes": not args.no_classes, "cache": args.cache,
+            "memory": None if args.memory == None else int(args.memory * 2**20)}
+
+    #the largest first, so that a long run doesn't start last
+    domains.sort(key = lambda d: -d[1])
+    tasks = []
+    for name, size, location in domains:
+        outbase = os.path.join(args.outdir, name[:-len(".spt")])
+        os.makedirs(os.path.dirname(outbase) or ".", exist_ok = True)
+        tasks.append((name, location, outbase, opts))
+
+    print("{} domains, {} at once.".format(len(tasks), args.jobs))
+    results = []
+    for res in runBatch(tasks, args.jobs, args.timeout):
+        print("{}: {} ({:.3f} s){}".format(res["domain"], res["status"], res["seconds"], \
+              ", " + res["error"] if "error" in res else ""), flush = True)
+        results.append(res)
+
+    results.sort(key = lambda r: metrics.naturalKey(r["domain"]))
+    print()
+    printSummary(results)
+
+    with open(os.path.join(args.outdir, "summary.json"), 'w') as outf:
+        json.dump({"source": args.source, "depth": args.depth, "results": results}, outf, indent = 1)
+    failed = [r for r in results if r["status"] != "ok"]
+    print("{} of {} domains done, summary in {}.".format(len(results) - len(failed), len(results), \
+                                                          os.path.join(args.outdir, "summary.json")))
+    if len(failed) > 0:
+        sys.exit(1)
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# author: Michal Knapik, ICS PAS 2015
+
+#the requests are POSTed as JSON objects, with the domain given by
+#its contents ("domain") or by a path readable by the server ("file"):
+#  curl -d '{"file": "examples/paperexample.spt", "depth": 6}' localhost:8642/build
+#and the optional fields:
+#  depth    unfolding depth, null (default) for unbounded
+#  classes  collapse the equivalent actions (default true)
+#  relevant over the actions that can feed the goal only, the others set
+#           to false, see spaceCut.py -r (default false)
+#  share    /sat: define-fun sharing (default false)
+#  limit    /enumerate: at most this many non-plans (default 100)
+#  sample   /enumerate: draw them uniformly, seeded by seed (default false)
+#GET /stats reports the caches. The errors are answered as {"error": message},
+#with 400 for a malformed request or a field of the wrong type.
+
+from checker import service
+import argparse
+import http.server
+import json
+import traceback
+
+class requesthandler(http.server.BaseHTTPRequestHandler):
+
+    #path -> (the method of the service, the content type of its answer)
+    routes = {"/build": ("build", "application/json"),
+              "/sat": ("sat", "text/plain"),
+              "/enumerate": ("enumerate", "application/json")}
+    #field -> the name of its JSON type, and its test; a bool is no number here
+    fields = {"domain": ("a string", lambda v: isinstance(v, str)),
+              "file": ("a string", lambda v: isinstance(v, str)),
+              "depth": ("a non-negative integer or null", lambda v: v is None or isCount(v)),
+              "classes": ("true or false", lambda v: isinstance(v, bool)),
+              "relevant": ("true or false", lambda v: isinstance(v, bool)),
+              "share": ("true or false", lambda v: isinstance(v, bool)),
+              "limit": ("a non-negative integer", lambda v: isCount(v)),
+              "sample": ("true or false", lambda v: isinstance(v, bool)),
+              "seed": ("an integer", lambda v: isinstance(v, int) and not isinstance(v, bool))}
+
+    def answer(self, code, ctype, body):
+        body = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def answerError(self, code, msg):
+        self.answer(code, "application/json", json.dumps({"error": msg}))
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.answer(200, "application/json", json.dumps(self.server.service.getStats()))
+        else:
+            self.answerError(404, "unknown request {}".format(self.path))
+
+    def do_POST(self):
+        if self.path not in requesthandler.routes:
+            self.answerError(404, "unknown request {}".format(self.path))
+            return
+        method, ctype = requesthandler.routes[self.path]
+
+        try:
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+            checkRequest(req)
+        except ValueError as e:
+            #json.JSONDecodeError and UnicodeDecodeError are ValueErrors too
+            self.answerError(400, "bad request: {}".format(e))
+            return
+
+        try:
+            res = getattr(self.server.service, method)(req)
+        except (ValueError, IOError, AttributeError) as e:
+            #AttributeError: the domain didn't match the parser's patterns
+            traceback.print_exc()
+            self.answerError(422, "can't process the domain: {}".format(e))
+            return
+        except Exception as e:
+            #never an empty reply
+            traceback.print_exc()
+            self.answerError(500, "internal error: {}".format(e))
+            return
+        self.answer(200, ctype, res if isinstance(res, str) else json.dumps(res))
+
+def isCount(v):
+    return isinstance(v, int) and not isinstance(v, bool) and v >= 0
+
+def checkRequest(req):
+    """Raises ValueError unless req is a JSON object giving a domain or
+    a file, with the fields of the right types (see the top)."""
+    if not isinstance(req, dict):
+        raise ValueError("not a JSON object")
+    if "domain" not in req and "file" not in req:
+        raise ValueError("no domain or file given")
+    for k, v in req.items():
+        if k in requesthandler.fields and not requesthandler.fields[k][1](v):
+            raise ValueError("{} has to be {}, not {}".format(k, requesthandler.fields[k][0], json.dumps(v)))
+
+
+if __name__ == "__main__":
+    print("{:^45}".format("*** SpaceCut server ***"))
+    print('-'*45)
+
+    optpar = argparse.ArgumentParser(description='Serves SpaceCut builds, SAT exports and enumerations over HTTP.')
+    optpar.add_argument('-p', '--port', type=int, default=8642, help='port to listen on (default 8642)')
+    optpar.add_argument('--host', type=str, default="127.0.0.1", help='address to listen on (default 127.0.0.1)')
+    optpar.add_argument('-n', '--capacity', metavar='N', type=int, default=16, \
+                        help='keep the last N domains and N built non-plans in memory (default 16)')
+    optpar.add_argument('--cache', metavar='DIR', type=str, \
+                        help='also keep the parsed domains in DIR, keyed by the hash of the file')
+
+    args = optpar.parse_args()
+    server = http.server.ThreadingHTTPServer((args.host, args.port), requesthandler)
+    server.daemon_threads = True
+    server.service = service.spacecutservice(args.capacity, args.cache)
+
+    print("Listening on {}:{}.".format(args.host, args.port), flush = True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    server.server_close()
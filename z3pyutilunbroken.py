@@ -22,7 +22,11 @@ def askey(n):
 
 def get_vars(f):
     r = set()
+    seen = set() #shared subterms are visited once
     def collect(f):
+      if askey(f) in seen:
+          return
+      seen.add(askey(f))
       if is_const(f): 
           if f.decl().kind() == Z3_OP_UNINTERPRETED and not askey(f) in r:
               r.add(askey(f))